@@ -0,0 +1,148 @@
+"""
+Offline benchmark for the sync pipeline of example_xlsx.py / example_google.py,
+with synthetic libraries and in-process stand-ins for yandex_music.Client and gspread.
+
+Stages (second run, on an existing table):
+    bulk_read -> get_online_data -> import_changes -> upload_changed_likes -> bulk_update
+
+Before that, the table is created (first run, reported as 'create') and changed:
+some likes are added/removed in the "app" and some checkboxes are unset in the table.
+
+Usage:
+    python -m benchmarks.bench_sync --sizes 1000 10000 100000 --backends xlsx google
+"""
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+from collections import Counter
+from ymusic_liketable import Liketable, TableHelper, XlsxSource, GoogleSheetSource, SqliteSource, RequestScheduler
+from .fake_yandex import FakeYandexClient
+from .fake_gspread import FakeGspreadClient
+
+class StageTimer:
+    """
+    Measures wall time, peak traced memory and API calls for each stage.
+    """
+
+    def __init__(self, counters: list, trace_memory: bool=True):
+        self.counters = counters
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def run(self, name: str, f, *args, **kwargs):
+        calls_before = self._calls()
+        if self.trace_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        result = f(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        peak = 0
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        calls = self._calls()
+        calls.subtract(calls_before)
+
+        self.results.append({
+            'stage': name,
+            'seconds': elapsed,
+            'peak_mib': peak / 2**20,
+            'calls': {k: v for k, v in calls.items() if v}
+        })
+        return result
+
+    def _calls(self) -> Counter:
+        total = Counter()
+        for prefix, counter in self.counters:
+            total.update({prefix + k: v for k, v in counter().items()})
+        return total
+
+def make_source(backend: str, workdir: str):
+    if backend == 'xlsx':
+        return XlsxSource(filename=os.path.join(workdir, 'changes.xlsx')), None
+    elif backend == 'google':
+        gc = FakeGspreadClient()
+        # No quota pacing for the in-process sheet, stages measure our own work
+        scheduler = RequestScheduler(requests_per_minute={'read': 10**9, 'write': 10**9})
+        return GoogleSheetSource(gc=gc, spreadsheet_url='https://docs.google.com/spreadsheets/d/fake', scheduler=scheduler), gc
+    elif backend == 'sqlite':
+        return SqliteSource(filename=os.path.join(workdir, 'changes.db')), None
+    raise ValueError('Unknown backend: %s' % backend)
+
+def bench(num_likes: int, backend: str, trace_memory: bool=True, change_ratio: float=0.01) -> list:
+    """
+    Run the pipeline for a synthetic library.
+
+    Returns:
+        List of stage results: stage, seconds, peak_mib, calls
+    """
+    client = FakeYandexClient(num_likes)
+    w = Liketable(token='', language='en', client=client)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source, gc = make_source(backend, workdir)
+
+        counters = [('ym.', lambda: client.calls)]
+        if gc:
+            counters.append(('gs.', lambda: gc.calls))
+
+        timer = StageTimer(counters, trace_memory=trace_memory)
+
+        # First run: create the table
+        def create():
+            table_data = source.bulk_read(no_metadata=True)
+            online_data = w.get_online_data()
+            w.import_changes(online_data, table_data)
+            source.bulk_write(TableHelper.sort(table_data))
+
+        timer.run('create', create)
+
+        # Changes between runs: in the app and in the table
+        num_changes = max(1, int(num_likes * change_ratio))
+        client.simulate_app_changes(num_new=num_changes, num_removed=num_changes)
+
+        table_data = source.bulk_read(no_metadata=True)
+        old_data = TableHelper.snapshot(table_data)
+        for c in table_data[::max(1, len(table_data) // num_changes)]:
+            c['like_on'] = False
+        source.bulk_update(table_data, cached_old_data=old_data)
+
+        # Second run: sync, like in the examples
+        no_metadata = backend == 'google'
+        table_data = timer.run('bulk_read', source.bulk_read, no_metadata=no_metadata)
+        old_data = TableHelper.snapshot(table_data)
+        online_data = timer.run('get_online_data', w.get_online_data)
+        timer.run('import_changes', w.import_changes, online_data, table_data)
+        timer.run('upload_changed_likes', w.upload_changed_likes, online_data, table_data)
+        timer.run('bulk_update', source.bulk_update, table_data, cached_old_data=old_data)
+
+    return timer.results
+
+def print_results(num_likes: int, backend: str, results: list):
+    print('\n%s, %d likes' % (backend, num_likes))
+    print('%-22s %10s %10s  %s' % ('stage', 'seconds', 'peak MiB', 'API calls'))
+    for r in results:
+        calls = ', '.join('%s %d' % kv for kv in sorted(r['calls'].items()))
+        print('%-22s %10.3f %10.1f  %s' % (r['stage'], r['seconds'], r['peak_mib'], calls))
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline sync pipeline benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--backends', nargs='+', default=['xlsx', 'google'], choices=['xlsx', 'google', 'sqlite'])
+    parser.add_argument('--no-memory', action='store_true', help='Do not trace memory (tracing slows down stages)')
+    args = parser.parse_args()
+
+    for num_likes in args.sizes:
+        for backend in args.backends:
+            results = bench(num_likes, backend, trace_memory=not args.no_memory)
+            print_results(num_likes, backend, results)
+
+if __name__ == '__main__':
+    main()
+
+# End
@@ -0,0 +1,113 @@
+"""
+Offline write -> update -> read round trip checks of the schema sources (SqliteSource, ArrowSource): rows matched
+by like key (see utility.like_key), empty rows kept in place, checkboxes and new rows of bulk_update read back.
+ArrowSource checks need pyarrow (poetry install -E arrow), skipped without it.
+
+Usage:
+    python -m benchmarks.check_sources
+"""
+import os
+import sqlite3
+import tempfile
+from ymusic_liketable import SqliteSource, ArrowSource
+from ymusic_liketable.source_arrow import pa
+
+def track(track_id: str, album_id: str, like_on: bool=True) -> dict:
+    return dict(like_on=like_on, artist_id='1', album_id=album_id, track_id=track_id, timestamp='2024-01-01T00:00:00+00:00', track='Track %s' % track_id)
+
+def empty() -> dict:
+    return dict(like_on=False, artist_id='', album_id='', track_id='', timestamp='')
+
+def ids(rows: list) -> list:
+    return [(c['artist_id'], c['album_id'], c['track_id']) for c in rows]
+
+def check_round_trip(source):
+    # Empty rows between likes (e.g. kept for alignment with another table) and an album like
+    rows = [
+        track('10', '100'),
+        empty(),
+        empty(),
+        dict(like_on=True, artist_id='1', album_id='200', track_id='', timestamp='2024-01-02T00:00:00+00:00'),
+        track('11', '100', like_on=False),
+    ]
+    source.bulk_write(rows)
+    read = source.bulk_read()
+    assert ids(read) == ids(rows), ids(read)
+    assert [c['like_on'] for c in read] == [c['like_on'] for c in rows]
+    assert read[0]['track'] == 'Track 10'
+
+    # Uncheck a track, check another one, add the same track with another album id (same like) and a new track
+    new_data = source.bulk_read()
+    new_data[0]['like_on'] = False
+    new_data[4]['like_on'] = True
+    new_data += [track('10', '300'), track('12', '300')]
+    source.bulk_update(new_data)
+
+    read = source.bulk_read()
+    assert ids(read) == ids(rows) + [('1', '300', '12')], ids(read)
+    assert [c['like_on'] for c in read] == [False, False, False, True, True, True]
+    assert read[5]['track'] == 'Track 12'
+
+def check_sqlite():
+    with tempfile.TemporaryDirectory() as workdir:
+        source = SqliteSource(filename=os.path.join(workdir, 'changes.sqlite'))
+        check_round_trip(source)
+
+        # Same track with another album id is the same like: skipped by bulk_write
+        source.bulk_write([track('10', '100'), empty(), track('10', '300'), track('11', '100')])
+        assert ids(source.bulk_read()) == [('1', '100', '10'), ('', '', ''), ('1', '100', '11')]
+
+def check_sqlite_old_file():
+    # File of the first SqliteSource version: unique index on the ids triple, no like key column
+    with tempfile.TemporaryDirectory() as workdir:
+        filename = os.path.join(workdir, 'changes.sqlite')
+        db = sqlite3.connect(filename)
+        columns = ', '.join(
+            '%s INTEGER NOT NULL DEFAULT 0' % k if k == 'like_on' else "%s TEXT NOT NULL DEFAULT ''" % k
+            for k in SqliteSource.COLUMN_KEYS
+        )
+        db.execute('CREATE TABLE likes (row INTEGER PRIMARY KEY, %s)' % columns)
+        db.execute('CREATE UNIQUE INDEX likes_ids ON likes (artist_id, album_id, track_id)')
+        db.execute("INSERT INTO likes (row, like_on, artist_id, album_id, track_id) VALUES (2, 1, '1', '100', '10')")
+        db.execute("INSERT INTO likes (row, like_on, artist_id, album_id, track_id) VALUES (3, 1, '1', '300', '10')")
+        db.commit()
+        db.close()
+
+        source = SqliteSource(filename=filename)
+        new_data = source.bulk_read()
+        assert len(new_data) == 2
+        new_data[0]['like_on'] = False
+        new_data.append(track('12', '300'))
+        source.bulk_update(new_data)
+
+        read = source.bulk_read()
+        assert ids(read) == [('1', '100', '10'), ('1', '300', '10'), ('1', '300', '12')], ids(read)
+        assert [c['like_on'] for c in read] == [False, True, True]
+
+def check_arrow():
+    with tempfile.TemporaryDirectory() as workdir:
+        for filename in ('changes.arrow', 'changes.parquet'):
+            source = ArrowSource(filename=os.path.join(workdir, filename))
+            check_round_trip(source)
+
+            # Reads by record batch: rows across batch boundaries, from min_row to max_row
+            source.READ_BATCH_SIZE = 2
+            source.bulk_write(source.bulk_read())
+            with source._open_read() as wb:
+                rows = list(source._bulk_read(wb, min_row=3, max_row=6, column_count=source.MIN_COLUMNS))
+            assert ids(rows) == [('', '', ''), ('', '', ''), ('1', '200', ''), ('1', '100', '11')], ids(rows)
+            assert ids(source.bulk_read()) == [('1', '100', '10')] + ids(rows) + [('1', '300', '12')]
+
+def main():
+    checks = (check_sqlite, check_sqlite_old_file, check_arrow)
+    for check in checks:
+        if check is check_arrow and pa is None:
+            print('skip', check.__name__, '(pyarrow not installed)')
+            continue
+        check()
+        print('ok', check.__name__)
+
+if __name__ == '__main__':
+    main()
+
+# End
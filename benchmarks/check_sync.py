@@ -0,0 +1,198 @@
+"""
+Offline checks of sync runs with the last run state (SyncState), like in example_xlsx.py,
+against the in-process yandex_music stand-in: what is skipped when nothing changed (or the tracks library
+revision is the same), and that changes in the app or in the table end up the same online and in the table.
+
+Usage:
+    python -m benchmarks.check_sync
+"""
+import os
+import tempfile
+from yandex_music import TracksList
+from ymusic_liketable import Liketable, TableHelper, SyncState, XlsxSource
+from .fake_yandex import FakeYandexClient
+
+class PartialResponseYandexClient(FakeYandexClient):
+    """
+    Stand-in answering the conditional liked tracks request for a moved revision with part of the list.
+    """
+
+    def users_likes_tracks(self, if_modified_since_revision: int=0, *args, **kwargs) -> TracksList:
+        tracks = super().users_likes_tracks(if_modified_since_revision, *args, **kwargs)
+        if if_modified_since_revision and tracks.revision != if_modified_since_revision:
+            return TracksList(uid=tracks.uid, revision=tracks.revision, tracks=tracks.tracks[:10])
+        return tracks
+
+class SyncRun:
+    """
+    Sync flow of example_xlsx.py for a table file and a sync state file in workdir.
+    """
+
+    def __init__(self, client: FakeYandexClient, workdir: str):
+        self.client = client
+        self.w = Liketable(token='', language='en', client=client)
+        self.source = XlsxSource(filename=os.path.join(workdir, 'changes.xlsx'))
+        self.sync_state_filename = os.path.join(workdir, 'sync_state.json')
+
+    def run(self) -> bool:
+        """
+        One sync run. Returns True if there were changes to sync.
+        """
+        sync_state = SyncState(self.sync_state_filename)
+
+        table_data = self.source.bulk_read()
+        old_data = TableHelper.snapshot(table_data)
+
+        online_data = self.w.get_online_data(sync_state=sync_state if old_data else None)
+
+        changed = not old_data or not sync_state.is_unchanged(online_data, table_data)
+        changed_entities = sync_state.changed_entities(online_data, table_data) if old_data else None
+
+        if changed:
+            self.w.import_changes(online_data, table_data, entities=changed_entities)
+            self.w.upload_changed_likes(online_data, table_data)
+
+            if old_data:
+                self.source.bulk_update(table_data, cached_old_data=old_data)
+            else:
+                self.source.bulk_write(TableHelper.sort(table_data))
+
+        if changed or sync_state.revisions_changed(online_data):
+            sync_state.update(online_data, table_data)
+            sync_state.save()
+
+        return changed
+
+    def liked_track_ids(self) -> set:
+        # Checked track rows of the table
+        return {c['track_id'] for c in self.source.bulk_read(no_metadata=True) if c['like_on'] and c['track_id']}
+
+    def assert_in_sync(self):
+        assert self.liked_track_ids() == set(self.client.liked_tracks), 'table and online liked tracks differ'
+
+def check_unchanged_run():
+    client = FakeYandexClient(300)
+    with tempfile.TemporaryDirectory() as workdir:
+        sync = SyncRun(client, workdir)
+        assert sync.run()
+        sync.assert_in_sync()
+
+        # Nothing changed: no import, no like mutations, the table file is not written
+        mtime = os.stat(sync.source.filename).st_mtime_ns
+        calls_before = client.calls.copy()
+        assert not sync.run()
+
+        calls = client.calls - calls_before
+        assert not any(k.endswith(('_add', '_remove')) for k in calls), calls
+        assert calls['tracks'] == 0 and calls['albums'] == 0 and calls['artists'] == 0, calls
+        assert os.stat(sync.source.filename).st_mtime_ns == mtime
+        sync.assert_in_sync()
+
+def check_table_changed():
+    client = FakeYandexClient(300)
+    with tempfile.TemporaryDirectory() as workdir:
+        sync = SyncRun(client, workdir)
+        sync.run()
+
+        # Unset the checkboxes of some liked tracks in the table
+        table_data = sync.source.bulk_read()
+        old_data = TableHelper.snapshot(table_data)
+        unset = set()
+        for c in table_data:
+            if c['track_id'] and c['like_on'] and len(unset) < 5:
+                c['like_on'] = False
+                unset.add(c['track_id'])
+        sync.source.bulk_update(table_data, cached_old_data=old_data)
+
+        # The run sees the table change and removes the likes online, the rows stay unchecked
+        assert sync.run()
+        assert not unset & set(client.liked_tracks)
+        sync.assert_in_sync()
+
+        assert not sync.run()
+
+def check_app_changed():
+    client = FakeYandexClient(300)
+    with tempfile.TemporaryDirectory() as workdir:
+        sync = SyncRun(client, workdir)
+        sync.run()
+
+        # Likes added and removed in the app: new rows checked, removed ones unchecked
+        client.simulate_app_changes(num_new=10, num_removed=10)
+        assert sync.run()
+        sync.assert_in_sync()
+
+        assert not sync.run()
+
+def check_revision_unchanged():
+    client = FakeYandexClient(300)
+    with tempfile.TemporaryDirectory() as workdir:
+        sync = SyncRun(client, workdir)
+        sync.run()
+
+        # Same revision: one request, no tracks downloaded, liked ids from the state
+        calls_before, items_before = client.calls.copy(), client.items.copy()
+        assert not sync.run()
+        assert (client.calls - calls_before)['users_likes_tracks'] == 1
+        assert (client.items - items_before)['users_likes_tracks'] == 0
+        sync.assert_in_sync()
+
+def check_revision_moved():
+    client = FakeYandexClient(300)
+    with tempfile.TemporaryDirectory() as workdir:
+        sync = SyncRun(client, workdir)
+        sync.run()
+
+        # Moved revision: the conditional response is the full list, downloaded once
+        client.simulate_app_changes(num_new=10, num_removed=10)
+        calls_before, items_before = client.calls.copy(), client.items.copy()
+        assert sync.run()
+        assert (client.calls - calls_before)['users_likes_tracks'] == 1
+        assert (client.items - items_before)['users_likes_tracks'] == len(client.liked_tracks)
+        sync.assert_in_sync()
+
+        assert not sync.run()
+
+def check_revision_moved_partial_response():
+    client = PartialResponseYandexClient(300)
+    with tempfile.TemporaryDirectory() as workdir:
+        sync = SyncRun(client, workdir)
+        sync.run()
+
+        # Part of the list for a moved revision: the full list is requested, no like is lost
+        client.simulate_app_changes(num_new=5, num_removed=5)
+        liked = set(client.liked_tracks)
+        calls_before = client.calls.copy()
+        assert sync.run()
+        assert (client.calls - calls_before)['users_likes_tracks'] == 2
+        assert set(client.liked_tracks) == liked
+        sync.assert_in_sync()
+
+def check_revision_moved_many_removed():
+    client = FakeYandexClient(300)
+    with tempfile.TemporaryDirectory() as workdir:
+        sync = SyncRun(client, workdir)
+        sync.run()
+
+        # Half of the liked tracks removed in the app: the full list is requested again to be sure
+        client.simulate_app_changes(num_new=0, num_removed=len(client.liked_tracks) // 2)
+        liked = set(client.liked_tracks)
+        calls_before = client.calls.copy()
+        assert sync.run()
+        assert (client.calls - calls_before)['users_likes_tracks'] == 2
+        assert set(client.liked_tracks) == liked
+        sync.assert_in_sync()
+
+def main():
+    checks = (
+        check_unchanged_run, check_table_changed, check_app_changed,
+        check_revision_unchanged, check_revision_moved, check_revision_moved_partial_response, check_revision_moved_many_removed,
+    )
+    for check in checks:
+        check()
+        print('ok', check.__name__)
+
+if __name__ == '__main__':
+    main()
+
+# End
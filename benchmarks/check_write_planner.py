@@ -0,0 +1,89 @@
+"""
+Offline checks of joined Google Sheets writes (WritePlanner, SpreadsheetContext with deferred_write),
+against the in-process gspread stand-in that counts requests.
+
+Usage:
+    python -m benchmarks.check_write_planner
+"""
+import gspread
+from ymusic_liketable import GoogleSheetSource, RequestScheduler
+from ymusic_liketable.write_planner import WritePlanner
+from ymusic_liketable.source_google import SpreadsheetContext
+from .fake_gspread import FakeGspreadClient
+
+def make_scheduler() -> RequestScheduler:
+    # No quota pacing for the in-process sheet
+    return RequestScheduler(requests_per_minute={'read': 10**9, 'write': 10**9})
+
+def check_plan_ranges():
+    planner = WritePlanner(max_cells_per_request=20)
+
+    # 10 rows x 3 adjacent columns: one block of 30 cells, split by rows at 20 cells (6 rows of 3)
+    for row in range(1, 11):
+        for col in range(1, 4):
+            planner.add(row, col, '%d,%d' % (row, col))
+
+    ranges = planner.plan_ranges()
+    assert [r['range'] for r in ranges] == ['A1:C6', 'A7:C10'], ranges
+    assert all(sum(len(v) for v in r['values']) <= 20 for r in ranges)
+    assert ranges[1]['values'][0] == ['7,1', '7,2', '7,3']
+
+    # Not adjacent columns are separate ranges, a single cell is a single cell range
+    planner = WritePlanner()
+    planner.add(2, 1, True)
+    planner.add(2, 5, 'x')
+    planner.add(3, 1, False)
+    assert [r['range'] for r in planner.plan_ranges()] == ['A2:A3', 'E2']
+
+    # Requests are chunked by payload size too
+    planner = WritePlanner(max_cells_per_request=20)
+    for row in range(1, 31):
+        planner.add(row, 1, row)
+    assert [len(sum((r['values'] for r in data), [])) for data in planner.plan_requests()] == [20, 10]
+
+def check_deferred_update_cells(num_rows: int=500):
+    gc = FakeGspreadClient()
+    wb = gc.open_by_url('https://docs.google.com/spreadsheets/d/fake')
+    worksheet = wb.sheet1
+
+    # Checkbox and timestamp of N updated rows: two column ranges, one values:batchUpdate
+    with SpreadsheetContext(wb, worksheet, deferred_write=True, scheduler=make_scheduler()) as ctx:
+        for row in range(2, 2 + num_rows):
+            ctx.update_cells([gspread.Cell(row, 1, False), gspread.Cell(row, 5, 'ts%d' % row)])
+
+        # Nothing sent until the context is done
+        assert gc.calls['batch_update'] == 0
+
+    assert gc.calls['batch_update'] == 1, gc.calls
+    assert gc.calls['update_cells'] == 0, gc.calls
+    assert worksheet.cells[(2, 1)] is False and worksheet.cells[(1 + num_rows, 5)] == 'ts%d' % (1 + num_rows)
+
+def check_bulk_update(num_rows: int=500):
+    gc = FakeGspreadClient()
+    source = GoogleSheetSource(gc=gc, spreadsheet_url='https://docs.google.com/spreadsheets/d/fake', scheduler=make_scheduler())
+
+    rows = [
+        {'like_on': True, 'artist_id': '', 'album_id': '', 'track_id': str(i), 'timestamp': '2024-01-01T00:00:00+00:00',
+         'artist': 'a', 'genres': '', 'album': 'b', 'track': 'c%d' % i, 'year': '2000', 'genre': ''}
+        for i in range(num_rows)
+    ]
+    source.bulk_write(rows)
+
+    # Unset every other like: rows are not adjacent, still one request
+    old_data = source.bulk_read(no_metadata=True)
+    changed = [dict(c, like_on=False, timestamp='') if i % 2 else dict(c) for i, c in enumerate(rows)]
+    calls_before = gc.calls['batch_update']
+    source.bulk_update(changed, cached_old_data=old_data)
+
+    assert gc.calls['batch_update'] - calls_before == 1, gc.calls
+    assert [c['like_on'] for c in source.bulk_read(no_metadata=True)] == [i % 2 == 0 for i in range(num_rows)]
+
+def main():
+    for check in (check_plan_ranges, check_deferred_update_cells, check_bulk_update):
+        check()
+        print('ok', check.__name__)
+
+if __name__ == '__main__':
+    main()
+
+# End
@@ -0,0 +1,146 @@
+import re
+import json
+from collections import Counter
+import gspread.utils
+
+class FakeWorksheet:
+    """
+    In-process stand-in for gspread.Worksheet, keeps cell values in a dict.
+
+    Counts requests by method in the spreadsheet `calls`, and bytes sent in `sent_bytes`.
+    """
+
+    def __init__(self, spreadsheet: 'FakeSpreadsheet', rows: int=1000, cols: int=26):
+        self.spreadsheet = spreadsheet
+        self.id = 0
+        self.title = 'Sheet1'
+        self.row_count = rows
+        self.col_count = cols
+        self.cells = {}
+
+    def _request(self, name: str, payload=None):
+        self.spreadsheet.calls[name] += 1
+        if payload is not None:
+            self.spreadsheet.sent_bytes += len(json.dumps(payload, default=str))
+
+    def _range(self, a1: str):
+        # 'A2:K', 'A2:K100', 'A2'
+        a1 = a1.split('!')[-1]
+        start, _, end = a1.partition(':')
+        end = end if end else start
+        min_row, min_col = gspread.utils.a1_to_rowcol(start)
+        m = re.match(r'([A-Z]+)(\d*)$', end)
+        max_col = gspread.utils.a1_to_rowcol(m.group(1) + '1')[1]
+        max_row = int(m.group(2)) if m.group(2) else self.row_count
+        return min_row, min_col, max_row, max_col
+
+    def clear(self):
+        self._request('clear')
+        self.cells = {}
+
+    def resize(self, rows: int=None, cols: int=None):
+        self._request('resize')
+        self.row_count = rows if rows else self.row_count
+        self.col_count = cols if cols else self.col_count
+
+    def update_cells(self, cell_list: list, value_input_option=None):
+        self._request('update_cells', [(c.row, c.col, c.value) for c in cell_list])
+        for c in cell_list:
+            self.cells[(c.row, c.col)] = c.value
+
+    def update(self, values: list, range_name: str=None, **kwargs):
+        self._request('update', values)
+        min_row, min_col, _, _ = self._range(range_name)
+        for i, row in enumerate(values):
+            for j, v in enumerate(row):
+                self.cells[(min_row + i, min_col + j)] = v
+
+    def batch_update(self, data: list, raw: bool=True, **kwargs):
+        self._request('batch_update', data)
+        for d in data:
+            min_row, min_col, _, _ = self._range(d['range'])
+            for i, row in enumerate(d['values']):
+                for j, v in enumerate(row):
+                    self.cells[(min_row + i, min_col + j)] = v
+
+    def get(self, range_name: str, major_dimension: str=None, **kwargs) -> list:
+        self._request('get')
+        min_row, min_col, max_row, max_col = self._range(range_name)
+        max_row = min(max_row, self.row_count)
+
+        if major_dimension == 'COLUMNS':
+            outer, inner = range(min_col, max_col + 1), range(min_row, max_row + 1)
+            cell = lambda o, i: self.cells.get((i, o), '')
+        else:
+            outer, inner = range(min_row, max_row + 1), range(min_col, max_col + 1)
+            cell = lambda o, i: self.cells.get((o, i), '')
+
+        values = []
+        for o in outer:
+            line = [cell(o, i) for i in inner]
+            # API trims trailing empty cells and rows/columns
+            while line and line[-1] in ('', None):
+                line.pop()
+            values.append(line)
+        while values and not values[-1]:
+            values.pop()
+
+        return values
+
+class FakeSpreadsheet:
+    """
+    In-process stand-in for gspread.Spreadsheet with one worksheet.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.sent_bytes = 0
+        self._sheet1 = FakeWorksheet(self)
+
+    @property
+    def sheet1(self) -> FakeWorksheet:
+        # Real gspread fetches spreadsheet metadata for this
+        self.calls['fetch_sheet_metadata'] += 1
+        return self._sheet1
+
+    def get_worksheet(self, index: int) -> FakeWorksheet:
+        return self.sheet1
+
+    def batch_update(self, body: dict):
+        self.calls['spreadsheet_batch_update'] += 1
+        self.sent_bytes += len(json.dumps(body, default=str))
+
+        # Apply requests that change values and size, others (validation, frozen rows) have no effect here
+        ws = self._sheet1
+        for request in body.get('requests', []):
+            if 'updateCells' in request:
+                r = request['updateCells']
+                if 'rows' in r:
+                    start = r['start']
+                    for i, row in enumerate(r['rows']):
+                        for j, v in enumerate(row['values']):
+                            ws.cells[(start['rowIndex'] + i + 1, start['columnIndex'] + j + 1)] = next(iter(v['userEnteredValue'].values()))
+                else:
+                    ws.cells = {}
+            elif 'updateSheetProperties' in request:
+                grid = request['updateSheetProperties']['properties'].get('gridProperties', {})
+                ws.row_count = grid.get('rowCount', ws.row_count)
+                ws.col_count = grid.get('columnCount', ws.col_count)
+
+class FakeGspreadClient:
+    """
+    In-process stand-in for gspread.Client, every URL opens the same spreadsheet.
+    """
+
+    def __init__(self):
+        self.spreadsheet = FakeSpreadsheet()
+
+    @property
+    def calls(self) -> Counter:
+        return self.spreadsheet.calls
+
+    def open_by_url(self, url: str) -> FakeSpreadsheet:
+        self.calls['open_by_url'] += 1
+        return self.spreadsheet
+
+# End
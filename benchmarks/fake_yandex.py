@@ -0,0 +1,152 @@
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from yandex_music import Track, TrackShort, TracksList, Album, Artist, Like
+
+class FakeYandexClient:
+    """
+    In-process stand-in for yandex_music.Client with a synthetic library of liked tracks, albums and artists.
+
+    Counts API calls by method name in `calls`, and ids sent/returned in `items`.
+    Optional latency (seconds) is added to every call.
+    """
+
+    # Client attribute used by de_json
+    report_unknown_fields = False
+
+    def __init__(self, num_likes: int, seed: int=1, latency: float=0):
+        self.latency = latency
+        self.calls = Counter()
+        self.items = Counter()
+        self._lock = threading.Lock()
+
+        r = random.Random(seed)
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        timestamp = lambda: (start + timedelta(seconds=r.randint(0, 5 * 365 * 24 * 3600))).isoformat()
+
+        # Library: ~90% tracks, 5% albums, 5% artists liked
+        num_artists = max(1, num_likes // 20)
+        num_albums = max(1, num_likes // 8)
+        num_tracks = max(1, num_likes)
+
+        genres = ['rock', 'pop', 'electronics', 'rusrock', 'jazz', 'phonk']
+        self.artists_db = {
+            i: Artist(id=i, name='Artist %d' % i, genres=[r.choice(genres)])
+            for i in range(1, num_artists + 1)
+        }
+        self.albums_db = {
+            i: Album(id=i, title='Album %d' % i, artists=[self.artists_db[r.randint(1, num_artists)]],
+                     genre=r.choice(genres), year=r.randint(1970, 2025))
+            for i in range(1, num_albums + 1)
+        }
+        self.tracks_db = {}
+        for i in range(1, num_tracks + 1):
+            album = self.albums_db[r.randint(1, num_albums)]
+            self.tracks_db[str(i)] = Track(id=str(i), title='Track %d' % i, albums=[album], artists=album.artists)
+
+        self.liked_tracks = {str(i): timestamp() for i in range(1, int(num_likes * 0.9) + 1)}
+        self.liked_albums = {i: timestamp() for i in r.sample(list(self.albums_db), min(num_albums, num_likes // 20))}
+        self.liked_artists = {i: timestamp() for i in r.sample(list(self.artists_db), min(num_artists, num_likes // 20))}
+
+        self.revisions = Counter({'tracks': 1})
+
+    def _call(self, name: str, num_items: int=0):
+        with self._lock:
+            self.calls[name] += 1
+            self.items[name] += num_items
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Likes lists
+
+    def users_likes_tracks(self, if_modified_since_revision: int=0, *args, **kwargs) -> TracksList:
+        # Not modified: same revision, no tracks
+        if if_modified_since_revision and if_modified_since_revision == self.revisions['tracks']:
+            self._call('users_likes_tracks')
+            return TracksList(uid=1, revision=self.revisions['tracks'], tracks=[])
+
+        self._call('users_likes_tracks', len(self.liked_tracks))
+        tracks = [TrackShort(id=k, timestamp=v, album_id=str(self.tracks_db[k].albums[0].id)) for k, v in self.liked_tracks.items()]
+        return TracksList(uid=1, revision=self.revisions['tracks'], tracks=tracks)
+
+    def users_likes_albums(self, *args, **kwargs) -> list:
+        self._call('users_likes_albums', len(self.liked_albums))
+        return [Like(type='album', timestamp=v, album=self.albums_db[k]) for k, v in self.liked_albums.items()]
+
+    def users_likes_artists(self, *args, **kwargs) -> list:
+        self._call('users_likes_artists', len(self.liked_artists))
+        return [Like(type='artist', timestamp=v, artist=self.artists_db[k]) for k, v in self.liked_artists.items()]
+
+    # Metadata
+
+    def tracks(self, track_ids: list, with_positions: bool=True, *args, **kwargs) -> list:
+        self._call('tracks', len(track_ids))
+        return [self.tracks_db[str(i)] for i in track_ids if str(i) in self.tracks_db]
+
+    def albums(self, album_ids: list, *args, **kwargs) -> list:
+        self._call('albums', len(album_ids))
+        return [self.albums_db[int(i)] for i in album_ids if int(i) in self.albums_db]
+
+    def artists(self, artist_ids: list, *args, **kwargs) -> list:
+        self._call('artists', len(artist_ids))
+        return [self.artists_db[int(i)] for i in artist_ids if int(i) in self.artists_db]
+
+    # Like mutations
+
+    def _now(self) -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def users_likes_tracks_add(self, track_ids: list, *args, **kwargs) -> bool:
+        self._call('users_likes_tracks_add', len(track_ids))
+        self.revisions['tracks'] += 1
+        self.liked_tracks.update((str(i), self._now()) for i in track_ids)
+        return True
+
+    def users_likes_tracks_remove(self, track_ids: list, *args, **kwargs) -> bool:
+        self._call('users_likes_tracks_remove', len(track_ids))
+        self.revisions['tracks'] += 1
+        for i in track_ids:
+            self.liked_tracks.pop(str(i), None)
+        return True
+
+    def users_likes_albums_add(self, album_ids: list, *args, **kwargs) -> bool:
+        self._call('users_likes_albums_add', len(album_ids))
+        self.liked_albums.update((int(i), self._now()) for i in album_ids)
+        return True
+
+    def users_likes_albums_remove(self, album_ids: list, *args, **kwargs) -> bool:
+        self._call('users_likes_albums_remove', len(album_ids))
+        for i in album_ids:
+            self.liked_albums.pop(int(i), None)
+        return True
+
+    def users_likes_artists_add(self, artist_ids: list, *args, **kwargs) -> bool:
+        self._call('users_likes_artists_add', len(artist_ids))
+        self.liked_artists.update((int(i), self._now()) for i in artist_ids)
+        return True
+
+    def users_likes_artists_remove(self, artist_ids: list, *args, **kwargs) -> bool:
+        self._call('users_likes_artists_remove', len(artist_ids))
+        for i in artist_ids:
+            self.liked_artists.pop(int(i), None)
+        return True
+
+    # Changes made in the app, between runs
+
+    def simulate_app_changes(self, num_new: int, num_removed: int, seed: int=2):
+        """
+        Like new tracks and remove some liked tracks, as if done in the app.
+        """
+        r = random.Random(seed)
+        self.revisions['tracks'] += 1
+
+        not_liked = [k for k in self.tracks_db if k not in self.liked_tracks]
+        for k in r.sample(not_liked, min(num_new, len(not_liked))):
+            self.liked_tracks[k] = self._now()
+
+        for k in r.sample(list(self.liked_tracks), min(num_removed, len(self.liked_tracks))):
+            del self.liked_tracks[k]
+
+# End
@@ -1,7 +1,6 @@
 # %%
 import logging
-from copy import deepcopy
-from ymusic_liketable import Liketable, TableHelper, GoogleSheetSource, GoogleHelper
+from ymusic_liketable import Liketable, TableHelper, MetadataCache, SyncState, UploadJournal, GoogleSheetSource, GoogleHelper
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,37 +28,61 @@ source = GoogleSheetSource(gc=gc, spreadsheet_url=table_url, refreshtoken_callba
 # %%
 yandex_token = open('token.txt').read().strip('\n')
 
-w = Liketable(token=yandex_token, language='en')
+# Local cache for tracks/albums/artists metadata, saves API requests when the table is recreated
+metadata_cache = MetadataCache('metadata.db')
+
+# Last sync run state, to skip import, upload and table write when nothing changed
+sync_state = SyncState('sync_state.json')
+
+# Like mutations done online, to retry the upload cell after an error without sending them again
+# (a new run needs no journal: it downloads the likes again, done mutations are not in the new diff)
+upload_journal = UploadJournal()
+
+w = Liketable(token=yandex_token, language='en', metadata_cache=metadata_cache, upload_journal=upload_journal)
 
 # %%
 table_data = source.bulk_read(no_metadata=True)
 
-old_data = deepcopy(table_data)
+old_data = TableHelper.snapshot(table_data)
 
 # %%
-online_data = w.get_online_data()
+# Last run state is of no use for an empty table (new or replaced): download and import everything
+online_data = w.get_online_data(sync_state=sync_state if old_data else None)
+
+# Likes changed in the app (by type) or in the table since the last run
+changed = not old_data or not sync_state.is_unchanged(online_data, table_data)
+changed_entities = sync_state.changed_entities(online_data, table_data) if old_data else None
+
+if not changed:
+    print('No changes since the last run')
 
 # %%
-info = w.import_changes(online_data, table_data)
+if changed:
+    info = w.import_changes(online_data, table_data, entities=changed_entities)
 
-print('Imported likes: ' + ', '.join('%s: %d' % kv for kv in info.items()))
+    print('Imported likes: ' + ', '.join('%s: %d' % kv for kv in info.items()))
 
 # %%
-info = w.upload_changed_likes(online_data, table_data)
+if changed:
+    info = w.upload_changed_likes(online_data, table_data)
 
-print('Uploaded likes: ' + ', '.join('%s: %d' % kv for kv in info.items()))
+    print('Uploaded likes: ' + ', '.join('%s: %d' % kv for kv in info.items()))
 
 # %%
-if old_data:
+if changed and old_data:
     source.bulk_update(table_data, cached_old_data=old_data)
     print('Google sheets data updated')
 
 # %%
-if not old_data:
+if changed and not old_data:
     table_data = TableHelper.sort(table_data)
     source.bulk_write(table_data)
     old_data = table_data
 
     print('Google sheets data was re/created with all current likes.')
 
-
+# %%
+# Also remember a new library revision, so the next run may skip the download
+if changed or sync_state.revisions_changed(online_data):
+    sync_state.update(online_data, table_data)
+    sync_state.save()
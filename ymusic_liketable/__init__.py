@@ -1,6 +1,14 @@
 from .liketable import Liketable
-from .source import Source
+from .source import Source, SchemaSource
 from .table_helper import TableHelper
 from .source_xlsx import XlsxSource
 from .source_google import GoogleSheetSource
+from .source_sqlite import SqliteSource
+from .source_arrow import ArrowSource
 from .google_helper import GoogleHelper
+from .like_row import LikeRow
+from .metadata_cache import MetadataCache
+from .metrics import Metrics, JsonLinesMetrics, PrometheusMetrics
+from .sync_state import SyncState
+from .request_scheduler import RequestScheduler
+from .upload_journal import UploadJournal
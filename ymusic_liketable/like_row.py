@@ -0,0 +1,104 @@
+from typing import Any, Iterable, Iterator, List
+
+class LikeRow:
+    """
+    Like item (table row): compact record with dict-like access by column key.
+
+        c['like_on'], c.get('artist'), 'genre' in c, c.update({...})
+
+    Keys which were never set are missing, like in a dict (e.g. metadata after no_metadata read).
+    'time' is the unix time for 'timestamp', not a table column.
+    """
+
+    __slots__ = (
+        'like_on',
+        'artist_id',
+        'album_id',
+        'track_id',
+        'timestamp',
+        'artist',
+        'genres',
+        'album',
+        'track',
+        'year',
+        'genre',
+        'time'
+    )
+
+    def __init__(self, **values):
+        for k, v in values.items():
+            setattr(self, k, v)
+
+    @classmethod
+    def fromkeys(cls, keys: Iterable[str], value: Any=None) -> 'LikeRow':
+        c = cls()
+        for k in keys:
+            setattr(c, k, value)
+        return c
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def __bool__(self) -> bool:
+        # Like an empty dict, a row with no keys set is false. Stops at the first set key, unlike __len__
+        return any(hasattr(self, k) for k in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (LikeRow, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    # Mutable record compared by value, not hashable (like dict)
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return 'LikeRow(%s)' % ', '.join('%s=%r' % kv for kv in self.items())
+
+    def get(self, key: str, default: Any=None) -> Any:
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def update(self, values: dict):
+        for k, v in values.items():
+            self[k] = v
+
+    def keys(self) -> List[str]:
+        return [k for k in self.__slots__ if hasattr(self, k)]
+
+    def values(self) -> List[Any]:
+        return [getattr(self, k) for k in self.keys()]
+
+    def items(self) -> List[tuple]:
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def copy(self) -> 'LikeRow':
+        """
+        Snapshot of the row. Values are immutable (str, bool, int), so this is a full copy.
+        """
+        c = LikeRow.__new__(LikeRow)
+        for k in self.__slots__:
+            if hasattr(self, k):
+                setattr(c, k, getattr(self, k))
+        return c
+
+# End
\ No newline at end of file
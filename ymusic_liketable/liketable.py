@@ -1,30 +1,143 @@
 
+import time
 import logging
-from typing import Tuple
-from yandex_music import Client
+from typing import List, Tuple
+from yandex_music import Client, Track, Album, Artist
 from datetime import datetime, timezone
-from .utility import iso_to_utc_timestamp, iso_to_utc_year
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from .utility import iso_to_utc_timestamps, iso_to_utc_year, like_key, like_entity
+from .like_row import LikeRow
+from .metadata_cache import MetadataCache
+from .metrics import Metrics
+from .sync_state import SyncState
+from .upload_journal import UploadJournal
 
 class Liketable:
-    def __init__(self, token: str, language: str):
+    # Metadata requests: ids per request and parallel requests
+    METADATA_BATCH_SIZE = 200
+    METADATA_WORKERS = 4
+
+    # Like mutations: ids per request and parallel requests
+    UPLOAD_BATCH_SIZE = 100
+    UPLOAD_WORKERS = 4
+
+    # Share of the liked tracks of the last sync that the response for a moved library revision must still have,
+    # to be taken as the full list (see _fetch_liked_tracks)
+    TRACKS_RESPONSE_MIN_KNOWN = 0.9
+
+    def __init__(self, token: str, language: str, metadata_batch_size: int=None, metadata_workers: int=None, metadata_cache: MetadataCache=None, client: Client=None, metrics: Metrics=None,
+                 upload_batch_size: int=None, upload_workers: int=None, upload_journal: UploadJournal=None):
+        """
+        Args:
+            token: Yandex Music token
+            language: API language for metadata
+            metadata_batch_size: ids per tracks/albums/artists request for metadata
+            metadata_workers: parallel requests for metadata
+            metadata_cache: local cache to check for tracks/albums/artists metadata before requesting the API
+            client: ready API client to use instead of a new one for the token (e.g. a stand-in for benchmarks)
+            metrics: timers and counters sink (see Metrics)
+            upload_batch_size: ids per like add/remove request
+            upload_workers: parallel like add/remove requests
+            upload_journal: journal of done like mutations, to retry a failed upload in the same process (see UploadJournal)
+        """
         self.token = token
-        self.client = Client(token, language=language).init()
+        self.client = client if client else Client(token, language=language).init()
+        self.metadata_batch_size = metadata_batch_size if metadata_batch_size else self.METADATA_BATCH_SIZE
+        self.metadata_workers = metadata_workers if metadata_workers else self.METADATA_WORKERS
+        self.metadata_cache = metadata_cache
+        self.metrics = metrics if metrics else Metrics()
+        self.upload_batch_size = upload_batch_size if upload_batch_size else self.UPLOAD_BATCH_SIZE
+        self.upload_workers = upload_workers if upload_workers else self.UPLOAD_WORKERS
+        self.upload_journal = upload_journal
+
+    def _api(self, method: str, *args, **kwargs):
+        # Call client method, counted in metrics
+        self.metrics.count('api_calls', api='yandex', method=method)
+        return getattr(self.client, method)(*args, **kwargs)
+
+    def _fetch_liked_tracks(self, revision: int=None, known_ids: set=None):
+        """
+        Get liked tracks list, or None if library revision is still the same.
 
-    def get_online_data(self) -> dict:
+        With the revision of the last sync, one conditional request (if-modified-since-revision) is sent.
+        What it returns for a moved revision is not documented: a partial list taken as full would unset
+        the missing likes in the table, then remove them online. So the response is taken as the full list
+        only if it still has most of the liked track ids of the last sync (known_ids, TRACKS_RESPONSE_MIN_KNOWN).
+        Otherwise (e.g. many likes removed in the app) the full list is requested again.
+        """
+        if not revision:
+            return self._api('users_likes_tracks')
+
+        tracks = self._api('users_likes_tracks', if_modified_since_revision=revision)
+        if tracks is not None and tracks.revision == revision:
+            return None
+
+        if tracks is not None:
+            known_ids = known_ids if known_ids else set()
+            num_known = len(known_ids & {str(i.id) for i in tracks})
+            if num_known >= len(known_ids) * self.TRACKS_RESPONSE_MIN_KNOWN:
+                return tracks
+
+            logging.info('Liked tracks response for a moved revision has %d of %d known likes, getting the full list', num_known, len(known_ids))
+
+        return self._api('users_likes_tracks')
+
+    def get_online_data(self, concurrent: bool=True, sync_state: SyncState=None) -> dict:
         """
         Use API to read all liked tracks, albums or artists.
+
+        Args:
+            concurrent: request tracks, albums and artists at the same time in threads, instead of one by one.
+            sync_state: last sync state; liked types with the same library revision are not downloaded,
+                their liked ids are taken from the state (items lists are empty, see 'unchanged' in result)
+
+        Returns:
+            Liked items per entity type, sorted from new to old, each with unix 'time' for its 'timestamp'.
         """
         logging.info('API working...')
 
         # API data state timestamp
         now_utc = datetime.now(timezone.utc)
+
+        # Library revision and liked ids of the last sync (only tracks library has a revision)
+        tracks_revision = sync_state.revision('tracks') if sync_state else None
+        known_track_ids = sync_state.liked_ids('tracks') if sync_state else None
         
         # Get list of all liked
-        tracks = self.client.users_likes_tracks()
-        albums = self.client.users_likes_albums()
-        artists = self.client.users_likes_artists()
+        fetchers = [
+            partial(self._fetch_liked_tracks, tracks_revision, known_track_ids),
+            partial(self._api, 'users_likes_albums'),
+            partial(self._api, 'users_likes_artists'),
+        ]
+        with self.metrics.timer('fetch', data='likes'):
+            if concurrent:
+                with ThreadPoolExecutor(max_workers=len(fetchers)) as executor:
+                    futures = [executor.submit(f) for f in fetchers]
+                    tracks, albums, artists = (f.result() for f in futures)
+            else:
+                tracks, albums, artists = (f() for f in fetchers)
+
+        unchanged = []
+        revisions = {}
 
-        logging.info('Online Likes: artists %d albums %d tracks %d', len(artists), len(albums), len(tracks))
+        if tracks is None:
+            # Not modified since the last sync: no download, no sort
+            unchanged.append('tracks')
+            revisions['tracks'] = tracks_revision
+            tracks = []
+            track_ids = sync_state.liked_ids('tracks')
+        else:
+            revisions['tracks'] = getattr(tracks, 'revision', None)
+            track_ids = {str(i.id) for i in tracks}
+
+        logging.info('Online Likes: artists %d albums %d tracks %d%s', len(artists), len(albums), len(track_ids),
+                     ' (unchanged: %s)' % ', '.join(unchanged) if unchanged else '')
+
+        # Unix time of every item, parsed once here for the import
+        for items in (tracks, albums, artists):
+            for i, t in zip(items, iso_to_utc_timestamps(i.timestamp for i in items)):
+                i.time = t
 
         # Base sort using timestamps from new to old
         tracks = sorted(tracks, key=lambda item: (item.timestamp, item.album_id), reverse=True)
@@ -35,6 +148,16 @@ class Liketable:
             'artists': artists,
             'albums': albums,
             'tracks': tracks,
+
+            # Liked ids per entity type (str), for constant time lookups against the table rows
+            'artist_ids': {str(i.artist.id) for i in artists},
+            'album_ids': {str(i.album.id) for i in albums},
+            'track_ids': track_ids,
+
+            # Library revision by entity type, and types not downloaded because revision is the same
+            'revisions': revisions,
+            'unchanged': unchanged,
+
             'timestamp': now_utc.isoformat(),
             'time': int(now_utc.timestamp()),
         }
@@ -55,25 +178,29 @@ class Liketable:
         rm_albums = []
         rm_tracks = []
 
+        liked_track_ids = online_data['track_ids']
+        liked_album_ids = online_data['album_ids']
+        liked_artist_ids = online_data['artist_ids']
+
         off_changes = [c for c in changes if not c['like_on']]
         on_changes = [c for c in changes if c['like_on']]
 
         for c in off_changes:
 
             if c.get('track_id'):
-                if not any(t for t in online_data['tracks'] if str(t.id) == c['track_id']):
+                if c['track_id'] not in liked_track_ids:
                     continue
 
                 rm_tracks.append(c['track_id'])
 
             elif c.get('album_id'):
-                if not any(a for a in online_data['albums'] if str(a.album.id) == str(c['album_id'])):
+                if str(c['album_id']) not in liked_album_ids:
                     continue
                 
                 rm_albums.append(c['album_id'])
 
             elif c.get('artist_id'):
-                if not any(a for a in online_data['artists'] if str(a.artist.id) == c['artist_id']):
+                if c['artist_id'] not in liked_artist_ids:
                     continue
                 
                 rm_artists.append(c['artist_id'])
@@ -89,19 +216,19 @@ class Liketable:
 
         for c in on_changes:
             if c.get('track_id'):
-                if any(t for t in online_data['tracks'] if str(t.id) == c['track_id']):
+                if c['track_id'] in liked_track_ids:
                     continue
                 
                 add_tracks.append(c['track_id'])
 
             elif c.get('album_id'):
-                if any(a for a in online_data['albums'] if str(a.album.id) == str(c['album_id'])):
+                if str(c['album_id']) in liked_album_ids:
                     continue
 
                 add_albums.append(c['album_id'])
 
             elif c.get('artist_id'):
-                if any(a for a in online_data['artists'] if str(a.artist.id) == c['artist_id']):
+                if c['artist_id'] in liked_artist_ids:
                     continue
                 
                 add_artists.append(c['artist_id'])
@@ -121,45 +248,100 @@ class Liketable:
 
         # No need to do anything if no likes to upload
         if any((rm_tracks, rm_albums, rm_artists, add_tracks, add_albums, add_artists)):
-            logging.info('API working...')
+            with self.metrics.timer('upload'):
+                logging.info('API working...')
 
-            if rm_tracks:
-                self.client.users_likes_tracks_remove(track_ids=rm_tracks)
-            if rm_albums:
-                self.client.users_likes_albums_remove(album_ids=rm_albums)
-            if rm_artists:
-                self.client.users_likes_artists_remove(artist_ids=rm_artists)
+                # Library revision moved with our own changes
+                if rm_tracks or add_tracks:
+                    online_data.get('revisions', {}).pop('tracks', None)
 
-            if add_tracks:
-                self.client.users_likes_tracks_add(track_ids=add_tracks)
-            if add_albums:
-                self.client.users_likes_albums_add(album_ids=add_albums)
-            if add_artists:
-                self.client.users_likes_artists_add(artist_ids=add_artists)
+                self._upload_mutations(online_data['time'], [
+                    ('users_likes_tracks_remove', 'track_ids', rm_tracks),
+                    ('users_likes_albums_remove', 'album_ids', rm_albums),
+                    ('users_likes_artists_remove', 'artist_ids', rm_artists),
+                    ('users_likes_tracks_add', 'track_ids', add_tracks),
+                    ('users_likes_albums_add', 'album_ids', add_albums),
+                    ('users_likes_artists_add', 'artist_ids', add_artists),
+                ])
 
-            logging.info('Table status: like %d not %d', len(on_changes), len(off_changes))
-            logging.info('This indicates no error!')
+                logging.info('Table status: like %d not %d', len(on_changes), len(off_changes))
+                logging.info('This indicates no error!')
+
+        # Journal is only for a retry of this upload, entries must not outlive it
+        if self.upload_journal is not None:
+            self.upload_journal.clear()
 
         return {
             'set': len(add_tracks + add_albums + add_artists),
             'unset': len(rm_tracks + rm_albums + rm_artists),
         }
 
-    def import_changes(self, online_data: dict, changes: list) -> dict:
+    def _upload_mutations(self, snapshot: int, mutations: List[Tuple[str, str, list]]):
+        """
+        Send like add/remove requests in chunks of upload_batch_size ids with upload_workers threads.
+
+        Args:
+            snapshot: time of the online data the mutations are computed from (online_data['time'])
+            mutations: list of (client method, ids argument name, ids)
+
+        Chunks done are recorded in upload_journal (if set) with the snapshot, and skipped by the next call
+        for the same snapshot. Failed chunks do not stop the others, the first error is raised after all chunks are done.
+        """
+        chunks = []
+        for method, arg, ids in mutations:
+            if self.upload_journal is not None:
+                ids = self.upload_journal.pending(snapshot, method, ids)
+            for n in range(0, len(ids), self.upload_batch_size):
+                chunks.append((method, arg, ids[n:n+self.upload_batch_size]))
+
+        def send(method, arg, ids):
+            start = time.perf_counter()
+            try:
+                self._api(method, **{arg: ids})
+            finally:
+                if self.metrics.enabled:
+                    self.metrics.observe('upload_chunk', time.perf_counter() - start, method=method)
+
+            if self.upload_journal is not None:
+                self.upload_journal.record(snapshot, method, ids)
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+            futures = {executor.submit(send, *chunk): chunk for chunk in chunks}
+            for f in as_completed(futures):
+                method, _, ids = futures[f]
+                if f.exception() is None:
+                    self.metrics.count('upload_chunks', method=method, status='ok')
+                else:
+                    self.metrics.count('upload_chunks', method=method, status='failed')
+                    logging.error('Like mutation failed: %s of %d ids: %s', method, len(ids), f.exception())
+                    errors.append(f.exception())
+
+        logging.info('Like mutation chunks: done %d failed %d', len(chunks) - len(errors), len(errors))
+
+        if errors:
+            raise errors[0]
+
+    def import_changes(self, online_data: dict, changes: list, entities: List[str]=None) -> dict:
         """
         Populate changes with updated information according to the online_data.
         Changes like_on and timestamps on the changed likes from current data.
         Appends new likes to the end, if any.
 
+        Args:
+            entities: only import likes of these types ('tracks', 'albums', 'artists'), e.g. changed since the last sync (see SyncState).
+                Default is all.
+
         Returns stats array with counters for unset/change/new
         """
         old_len = len(changes)
 
-        # Reflect likes removed from Yandex Music app
-        num_unset = self._import_unset_likes(online_data, changes)
+        with self.metrics.timer('diff'):
+            # Reflect likes removed from Yandex Music app
+            num_unset = self._import_unset_likes(online_data, changes, entities)
 
-        # Find new likes from Yandex.Music and add to changes
-        state = self._import_new_likes(online_data, changes)
+            # Find new likes from Yandex.Music and add to changes
+            state = self._import_new_likes(online_data, changes, entities)
 
         # Fetch metadata for new items (artist/track names, year, genre, etc)
         self._import_new_metadata(state, changes)
@@ -171,12 +353,12 @@ class Liketable:
             'new': len(changes) - old_len
         }
 
-    def _import_unset_likes(self, online_data: dict, changes: list) -> int:
+    def _import_unset_likes(self, online_data: dict, changes: list, entities: List[str]=None) -> int:
         num_unset = 0
 
-        liked_track_ids = [str(i.id) for i in online_data['tracks']]
-        liked_album_ids = [str(i.album.id) for i in online_data['albums']]
-        liked_artist_ids = [str(i.artist.id) for i in online_data['artists']]
+        liked_track_ids = online_data['track_ids']
+        liked_album_ids = online_data['album_ids']
+        liked_artist_ids = online_data['artist_ids']
 
         def found_in_online_data(c):
             if c['track_id']:
@@ -189,6 +371,8 @@ class Liketable:
                 return False
 
         for c in changes:
+            if entities is not None and like_entity(c) not in entities:
+                continue
             if c['like_on'] and c['timestamp'] and not found_in_online_data(c):
                 c['like_on'] = False
                 c['timestamp'] = ''
@@ -198,7 +382,7 @@ class Liketable:
         logging.info('Likes unset in table from online: %d', num_unset)
         return num_unset
 
-    def _import_new_likes(self, online_data: dict, changes: list) -> Tuple:
+    def _import_new_likes(self, online_data: dict, changes: list, entities: List[str]=None) -> Tuple:
         new_track_ids = []
         new_album_ids = []
         new_artist_ids = []
@@ -211,76 +395,159 @@ class Liketable:
             changes_max_time = max(d['time'] for d in changes)
 
         # Find likes set AFTER the file timestamp from API, and re-set checkbox in the file for those
-        select_newer_online = lambda key: (i for i in online_data[key] if iso_to_utc_timestamp(i.timestamp) > changes_max_time)
+        def select_newer_online(key):
+            if entities is not None and key not in entities:
+                return ()
+            return (i for i in online_data[key] if i.time > changes_max_time)
+
+        # Index table rows by like key -> row position, first row wins
+        changes_index = {}
+        for idx, c in enumerate(changes):
+            changes_index.setdefault(like_key(c), idx)
+
+        # Find and update one by like key, with func and userdata
+        def update_changes_at(key, f, i=None):
+            idx = changes_index.get(key)
+            if idx is None:
+                return False
+            c = changes[idx]
+            product = f(i, c)
+            changes[idx] = product if product is not None else c
+            return True
 
-        # Find and update one, with predicate, func, and userdata
-        def update_changes_where(predicate, f, i=None):
-            for idx, c in enumerate(changes):
-                if predicate(c):
-                    product = f(i, c)
-                    changes[idx] = product if product else c
-                    return True
-            return False
+        # Append a new row and keep the index up to date
+        def append_change(c):
+            changes_index.setdefault(like_key(c), len(changes))
+            changes.append(c)
 
         # Func to reset like
         def set_like_on(i, c):
             c['like_on'] = True
             c['timestamp'] = i.timestamp
-            c['time'] = iso_to_utc_timestamp(i.timestamp)
+            c['time'] = i.time
             return c
         
         for i in select_newer_online('artists'):
             if not i.artist.id:
                 continue
-            if update_changes_where(lambda c: not c['track_id'] and not c['album_id'] and c['artist_id'] == str(i.artist.id), set_like_on, i):
+            if update_changes_at((str(i.artist.id), '', ''), set_like_on, i):
                 num_set += 1
             else:
                 new_artist_ids.append(i.artist.id)
-                changes.append({
-                    'artist_id': str(i.artist.id),
-                    'album_id': '',
-                    'track_id': '',
-                    'like_on': True,
-                    'timestamp': i.timestamp,
-                    'time': iso_to_utc_timestamp(i.timestamp),
-                })
+                append_change(LikeRow(
+                    artist_id=str(i.artist.id),
+                    album_id='',
+                    track_id='',
+                    like_on=True,
+                    timestamp=i.timestamp,
+                    time=i.time,
+                ))
         
         for i in select_newer_online('albums'):
             if not i.album.id:
                 continue
-            if update_changes_where(lambda c: not c['track_id'] and c['album_id'] == str(i.album.id), set_like_on, i):
+            if update_changes_at(('', str(i.album.id), ''), set_like_on, i):
                 num_set += 1
             else:
                 new_album_ids.append(i.album.id)
-                changes.append({
-                    'artist_id': '',
-                    'album_id': str(i.album.id),
-                    'track_id': '',
-                    'like_on': True,
-                    'timestamp': i.timestamp,
-                    'time': iso_to_utc_timestamp(i.timestamp),
-                })
+                append_change(LikeRow(
+                    artist_id='',
+                    album_id=str(i.album.id),
+                    track_id='',
+                    like_on=True,
+                    timestamp=i.timestamp,
+                    time=i.time,
+                ))
 
         for i in select_newer_online('tracks'):
             if not i.id:
                 continue
-            if update_changes_where(lambda c: c['track_id'] == str(i.id), set_like_on, i):
+            if update_changes_at(('', '', str(i.id)), set_like_on, i):
                 num_set += 1
             else:
                 new_track_ids.append(i.id)
-                changes.append({
-                    'artist_id': '',
-                    'album_id': '',
-                    'track_id': str(i.id),
-                    'like_on': True,
-                    'timestamp': i.timestamp,
-                    'time': iso_to_utc_timestamp(i.timestamp),
-                })
+                append_change(LikeRow(
+                    artist_id='',
+                    album_id='',
+                    track_id=str(i.id),
+                    like_on=True,
+                    timestamp=i.timestamp,
+                    time=i.time,
+                ))
 
         logging.info('New likes add/set in table: %d', num_set)
 
         return num_set, new_track_ids, new_album_ids, new_artist_ids
 
+    def _fetch_metadata(self, track_ids: list, album_ids: list, artist_ids: list) -> Tuple[dict, dict, dict]:
+        """
+        Request tracks, albums and artists metadata in chunks of metadata_batch_size ids with metadata_workers threads.
+
+        Albums of the tracks are requested as soon as each tracks chunk is returned, artists of the albums likewise.
+        With metadata_cache, only ids missing from the cache are requested.
+
+        Returns:
+            track_info, album_info, artist_info: dicts of API objects by str(id)
+        """
+        info = {'tracks': {}, 'albums': {}, 'artists': {}}
+        requested = {'tracks': set(), 'albums': set(), 'artists': set()}
+
+        fetch = {
+            'tracks': lambda ids: self._api('tracks', with_positions=False, track_ids=ids),
+            'albums': lambda ids: self._api('albums', album_ids=ids),
+            'artists': lambda ids: self._api('artists', artist_ids=ids),
+        }
+
+        models = {'tracks': Track, 'albums': Album, 'artists': Artist}
+
+        # Use cache first, then request and cache the misses
+        def fetch_cached(key, ids):
+            if not self.metadata_cache:
+                return fetch[key](ids)
+
+            cached = self.metadata_cache.get_many(key, ids)
+            data = [models[key].de_json(d, self.client) for d in cached.values()]
+
+            missing = [i for i in ids if str(i) not in cached]
+            if missing:
+                fresh = fetch[key](missing)
+                self.metadata_cache.put_many(key, {str(i.id): i.to_dict() for i in fresh})
+                data += fresh
+
+            return data
+
+        with ThreadPoolExecutor(max_workers=self.metadata_workers) as executor:
+            pending = {}
+
+            # Submit ids not requested yet, in chunks
+            def submit(key, ids):
+                ids = [i for i in dict.fromkeys(ids) if str(i) not in requested[key]]
+                requested[key].update(str(i) for i in ids)
+                for n in range(0, len(ids), self.metadata_batch_size):
+                    pending[executor.submit(fetch_cached, key, ids[n:n+self.metadata_batch_size])] = key
+
+            submit('tracks', track_ids)
+            submit('albums', album_ids)
+            submit('artists', artist_ids)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    key = pending.pop(f)
+                    data = f.result()
+                    info[key].update((str(i.id), i) for i in data)
+
+                    # Next stage for this chunk
+                    if key == 'tracks':
+                        submit('albums', [i.albums[0].id for i in data if i.albums])
+                    elif key == 'albums':
+                        submit('artists', [i.artists[0].id for i in data if i.artists])
+
+        if self.metadata_cache:
+            logging.info('Metadata cache: ' + ', '.join('%s %d' % kv for kv in self.metadata_cache.stats().items()))
+
+        return info['tracks'], info['albums'], info['artists']
+
     def _import_new_metadata(self, state: Tuple, changes: list):
         _, new_track_ids, new_album_ids, new_artist_ids = state
 
@@ -288,29 +555,10 @@ class Liketable:
         if not any(c for c in state[1:]):
             return
 
-        track_info = {}
-        album_info = {}
-        artist_info = {}
-
         logging.info('API working...')
 
-        if new_track_ids:
-            data = self.client.tracks(with_positions=False, track_ids=list(set(new_track_ids)))
-            track_info = {str(i.id): i for i in data}
-            for track in data:
-                if track.albums:
-                    new_album_ids.append(track.albums[0].id)
-
-        if new_album_ids:
-            data = self.client.albums(album_ids=list(set(new_album_ids)))
-            album_info = {str(i.id): i for i in data}
-            for album in data:
-                if album.artists:
-                    new_artist_ids.append(album.artists[0].id)
-
-        if new_artist_ids:
-            data = self.client.artists(artist_ids=list(set(new_artist_ids)))
-            artist_info = {str(i.id): i for i in data}
+        with self.metrics.timer('fetch', data='metadata'):
+            track_info, album_info, artist_info = self._fetch_metadata(new_track_ids, new_album_ids, new_artist_ids)
 
         logging.info('New metadata: artists %d albums %d tracks %d', len(artist_info), len(album_info), len(track_info))
 
@@ -0,0 +1,104 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable
+
+class MetadataCache:
+    """
+    Local SQLite store for API metadata (tracks, albums, artists) as JSON dicts, by entity type and id.
+
+    Entries older than ttl (seconds) are treated as missing and evicted on open.
+    Counts hits and misses for get_many, see stats().
+    """
+
+    # Titles, years and genres rarely change
+    DEFAULT_TTL = 30 * 24 * 3600
+
+    def __init__(self, filename: str, ttl: int=None):
+        """
+        Args:
+            filename: path to SQLite file (created if needed)
+            ttl: seconds to keep entries, default is DEFAULT_TTL
+        """
+        self.filename = filename
+        self.ttl = ttl if ttl else self.DEFAULT_TTL
+
+        self.hits = 0
+        self.misses = 0
+
+        # Used from metadata fetch threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS metadata (kind TEXT, id TEXT, time INTEGER, data TEXT, PRIMARY KEY (kind, id))')
+
+        self.evict()
+
+    def get_many(self, kind: str, ids: Iterable) -> Dict[str, dict]:
+        """
+        Get cached data for the ids of entity type ('tracks', 'albums', 'artists').
+
+        Returns:
+            dict of data by str(id), only for ids found.
+        """
+        ids = [str(i) for i in ids]
+        min_time = int(time.time()) - self.ttl
+
+        found = {}
+        with self._lock:
+            # Keep under SQLite variables limit per query
+            for n in range(0, len(ids), 500):
+                part = ids[n:n+500]
+                query = 'SELECT id, data FROM metadata WHERE kind = ? AND time >= ? AND id IN (%s)' % ','.join('?' * len(part))
+                for id, data in self._db.execute(query, [kind, min_time] + part):
+                    found[id] = json.loads(data)
+
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+
+        return found
+
+    def put_many(self, kind: str, items: Dict[str, dict]):
+        """
+        Store data by str(id) for entity type. None values are not stored.
+        """
+        now = int(time.time())
+        rows = [(kind, str(id), now, json.dumps(compact(data), ensure_ascii=False)) for id, data in items.items()]
+
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO metadata (kind, id, time, data) VALUES (?, ?, ?, ?)', rows)
+
+    def evict(self) -> int:
+        """
+        Remove expired entries.
+
+        Returns:
+            Number of entries removed.
+        """
+        min_time = int(time.time()) - self.ttl
+        with self._lock, self._db:
+            num_removed = self._db.execute('DELETE FROM metadata WHERE time < ?', (min_time,)).rowcount
+
+        logging.debug('Metadata cache evicted: %d', num_removed)
+        return num_removed
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def close(self):
+        self._db.close()
+
+def compact(value):
+    # Drop None values recursively, API objects have lots of them
+    if isinstance(value, dict):
+        return {k: compact(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [compact(v) for v in value]
+    return value
+
+# End
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import IO, Iterator, Union
+
+class Metrics:
+    """
+    Metrics sink for timers and counters. This base is no-op (default everywhere).
+
+    Used names:
+        timers: 'read', 'fetch', 'diff', 'upload', 'upload_chunk' (labels method), 'write', 'throttle' (labels api, reason) (seconds)
+        counters: 'api_calls' (labels api, method), 'api_bytes' (labels api, direction), 'api_retries' (labels api, bucket),
+            'upload_chunks' (labels method, status), 'sidecar_reads' (labels status), 'sidecar_writes',
+            'rows_read', 'rows_written', 'cells_written'
+
+    Subclasses implement count() and observe().
+    """
+
+    # False for no-op, to skip computing values (e.g. request payload size)
+    enabled = False
+
+    def count(self, name: str, value: int=1, **labels):
+        """
+        Increase counter by value.
+        """
+        pass
+
+    def observe(self, name: str, seconds: float, **labels):
+        """
+        Record time spent for a timer.
+        """
+        pass
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Time a block:
+
+            with metrics.timer('read'):
+                ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.observe(name, time.perf_counter() - start, **labels)
+
+class JsonLinesMetrics(Metrics):
+    """
+    Writes every event as a JSON line: {"time": ..., "type": "counter"|"timer", "name": ..., "value": ..., "labels": {...}}
+    """
+
+    enabled = True
+
+    def __init__(self, output: Union[str, IO]):
+        """
+        Args:
+            output: file name (appended to) or text stream
+        """
+        self.output = open(output, 'a') if isinstance(output, str) else output
+        self._lock = threading.Lock()
+
+    def _write(self, type: str, name: str, value, labels: dict):
+        line = json.dumps({'time': time.time(), 'type': type, 'name': name, 'value': value, 'labels': labels})
+        with self._lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def count(self, name: str, value: int=1, **labels):
+        self._write('counter', name, value, labels)
+
+    def observe(self, name: str, seconds: float, **labels):
+        self._write('timer', name, seconds, labels)
+
+    def close(self):
+        self.output.close()
+
+class PrometheusMetrics(Metrics):
+    """
+    Aggregates counters and timers, renders Prometheus text format (e.g. for node_exporter textfile collector).
+
+        liketable_api_calls_total{api="yandex",method="tracks"} 3
+        liketable_read_seconds_sum 0.52
+        liketable_read_seconds_count 1
+    """
+
+    enabled = True
+
+    PREFIX = 'liketable_'
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: int=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            total, num = self.timers.get(key, (0.0, 0))
+            self.timers[key] = (total + seconds, num + 1)
+
+    def render(self) -> str:
+        def format_labels(labels):
+            if not labels:
+                return ''
+            return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+
+        lines = []
+        with self._lock:
+            for name in sorted({n for n, _ in self.counters}):
+                metric = '%s%s_total' % (self.PREFIX, name)
+                lines.append('# TYPE %s counter' % metric)
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append('%s%s %s' % (metric, format_labels(labels), value))
+
+            for name in sorted({n for n, _ in self.timers}):
+                metric = '%s%s_seconds' % (self.PREFIX, name)
+                lines.append('# TYPE %s summary' % metric)
+                for (n, labels), (total, num) in sorted(self.timers.items()):
+                    if n == name:
+                        lines.append('%s_sum%s %f' % (metric, format_labels(labels), total))
+                        lines.append('%s_count%s %d' % (metric, format_labels(labels), num))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename: str):
+        """
+        Write rendered metrics to a file, atomically (textfile collector may read it any time).
+        """
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_filename, filename)
+
+# End
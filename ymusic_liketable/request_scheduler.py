@@ -0,0 +1,147 @@
+import time
+import random
+import logging
+import threading
+from typing import Any, Callable, Dict
+from .metrics import Metrics
+
+class TokenBucket:
+    """
+    Requests pacing: `rate` requests per second on average, bursts up to `capacity` requests.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Take a token for one request.
+
+        Returns:
+            Seconds to wait before the request (0 if a token is available now).
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class RequestScheduler:
+    """
+    Paces API requests under per-minute quotas and retries throttled/failed requests.
+
+    Every request takes a token from its quota bucket (e.g. 'read', 'write') and waits if none is left.
+    Retryable errors (see `retryable`) are retried with jittered exponential backoff,
+    and the bucket rate is halved meanwhile, to be recovered step by step on success (AIMD).
+
+    Time spent waiting is reported as 'throttle' timer (labels api, reason='pacing'|'backoff'),
+    and retries as 'api_retries' counter. Totals are kept in `throttled_seconds` and `num_retries`.
+
+    Usage:
+
+        scheduler.call('write', worksheet.batch_update, data, raw=True)
+    """
+
+    # Sheets API quotas per user per minute
+    REQUESTS_PER_MINUTE = {'read': 60, 'write': 60}
+
+    # Requests in a burst, before pacing by the per-minute rate
+    BURST = 5
+
+    # Retries: up to MAX_RETRIES times, wait between BASE_DELAY * 2**attempt and MAX_DELAY seconds (jittered)
+    MAX_RETRIES = 10
+    BASE_DELAY = 1.0
+    MAX_DELAY = 64.0
+
+    # Adaptive rate after throttling: never below this share of the quota
+    MIN_RATE_FACTOR = 0.1
+
+    def __init__(self, requests_per_minute: Dict[str, int]=None, retryable: Callable[[Exception], bool]=None,
+                 max_retries: int=None, api: str='sheets', metrics: Metrics=None):
+        """
+        Args:
+            requests_per_minute: quota per bucket name (default REQUESTS_PER_MINUTE)
+            retryable: tells if the exception of a request is worth a retry (default: none is)
+            max_retries: retries per request before the error is raised (default MAX_RETRIES)
+            api: 'api' label for metrics
+            metrics: timers and counters sink (see Metrics)
+        """
+        self.requests_per_minute = requests_per_minute if requests_per_minute else self.REQUESTS_PER_MINUTE
+        self.retryable = retryable if retryable else (lambda e: False)
+        self.max_retries = self.MAX_RETRIES if max_retries is None else max_retries
+        self.api = api
+        self.metrics = metrics if metrics else Metrics()
+
+        self.buckets = {k: TokenBucket(v / 60, min(self.BURST, v)) for k, v in self.requests_per_minute.items()}
+        self.throttled_seconds = 0.0
+        self.num_retries = 0
+        self._lock = threading.Lock()
+
+    def _wait(self, seconds: float, reason: str):
+        if seconds <= 0:
+            return
+        time.sleep(seconds)
+        with self._lock:
+            self.throttled_seconds += seconds
+        if self.metrics.enabled:
+            self.metrics.observe('throttle', seconds, api=self.api, reason=reason)
+
+    def _acquire(self, bucket: str):
+        with self._lock:
+            delay = self.buckets[bucket].reserve()
+        self._wait(delay, 'pacing')
+
+    def _slow_down(self, bucket: str):
+        with self._lock:
+            b = self.buckets[bucket]
+            b.rate = max(b.rate / 2, self.requests_per_minute[bucket] / 60 * self.MIN_RATE_FACTOR)
+
+    def _speed_up(self, bucket: str):
+        with self._lock:
+            b = self.buckets[bucket]
+            quota_rate = self.requests_per_minute[bucket] / 60
+            if b.rate < quota_rate:
+                b.rate = min(quota_rate, b.rate + quota_rate * self.MIN_RATE_FACTOR)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Jittered exponential delay before retry number `attempt` (0-based): uniform in [d/2, d].
+        """
+        delay = min(self.MAX_DELAY, self.BASE_DELAY * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call(self, bucket: str, f: Callable, *args, **kwargs) -> Any:
+        """
+        Make request f(*args, **kwargs) within the bucket quota, retrying retryable errors.
+        """
+        attempt = 0
+        while True:
+            self._acquire(bucket)
+            try:
+                result = f(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self.retryable(e):
+                    raise
+
+                self._slow_down(bucket)
+                delay = self.backoff_delay(attempt)
+                logging.warning('API request failed, retry %d in %.1fs: %s', attempt + 1, delay, e)
+
+                with self._lock:
+                    self.num_retries += 1
+                self.metrics.count('api_retries', api=self.api, bucket=bucket)
+
+                self._wait(delay, 'backoff')
+                attempt += 1
+                continue
+
+            self._speed_up(bucket)
+            return result
+
+# End
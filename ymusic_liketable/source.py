@@ -1,6 +1,9 @@
 
 import logging
-from typing import ContextManager, List
+from typing import ContextManager, List, Tuple
+from .utility import like_key, rows_diff, iso_to_utc_timestamps, value_to_bool
+from .like_row import LikeRow
+from .metrics import Metrics
 
 class Source:
     """
@@ -37,11 +40,25 @@ class Source:
         """
         raise NotImplementedError()
 
-    def _bulk_read(self, wb, min_row: int, max_row: int, column_count: int) -> List[dict]:
+    def _open_read(self) -> ContextManager:
         """
-        Read N rows from "wb" resource and get list of dicts (dict = like item),
+        Get internal resource "wb" (read only) as context manager protocol.
+        Cleanup resources if needed in __exit__
+
+        Optional: defaults to _open_update. Sources may provide a cheaper read only mode.
+
+        Returns:
+            "wb" resource to use for read by _bulk_read.
+        """
+        return self._open_update()
+
+    def _bulk_read(self, wb, min_row: int, max_row: int, column_count: int) -> List[LikeRow]:
+        """
+        Read N rows from "wb" resource and get list of LikeRow (like item),
         with starting row number and max rows/cols count (if used)
 
+        Unix 'time' of rows is set by bulk_read, for all rows at once.
+
         May return many-many likes at once.
         """
         raise NotImplementedError()
@@ -50,6 +67,7 @@ class Source:
         """
         Re/write N rows to "wb" resource, given list of dicts (dict = like item),
         with starting row number and list of keys to re/write.
+        Each key is written to its own table column (see column_index), columns may be any subset of COLUMN_KEYS.
         """
         raise NotImplementedError()
 
@@ -73,7 +91,23 @@ class Source:
     # no_metadata reading must only provide ids, like_on, timestamp from each row.
     MIN_COLUMNS = 5
 
-    def bulk_read(self, no_metadata: bool=False) -> List[dict]:
+    # Columns rewritten by bulk_update for rows already in the table
+    UPDATE_KEYS = ['like_on', 'timestamp']
+
+    @classmethod
+    def column_index(cls, key: str) -> int:
+        """
+        Table column number (1-based) of a key.
+
+        Not the key position in the columns written: e.g. bulk_update writes ['like_on', 'timestamp'],
+        and timestamp must go to its column, not the second one (artist_id).
+        """
+        return cls.COLUMN_KEYS.index(key) + 1
+
+    # Timers and counters sink, no-op by default (sources may take one in __init__)
+    metrics = Metrics()
+
+    def bulk_read(self, no_metadata: bool=False) -> List[LikeRow]:
         """
         Read full data.
 
@@ -81,22 +115,30 @@ class Source:
             no_metadata: only read ids. Efficient for cases when data is not needed and job is possible.
 
         Returns:
-            List of likes from table as dicts.
+            List of likes from table as LikeRow.
         """
         num_columns = self.MIN_COLUMNS if no_metadata else len(self.COLUMN_KEYS)
 
-        with self._open_update() as wb:
-            read_items = self._bulk_read(wb=wb, min_row=2, max_row=None, column_count=num_columns)
-            return list(read_items)
+        with self.metrics.timer('read'), self._open_read() as wb:
+            read_items = list(self._bulk_read(wb=wb, min_row=2, max_row=None, column_count=num_columns))
+
+        # Add unix time 'time' key to the each element
+        for c, t in zip(read_items, iso_to_utc_timestamps(c.get('timestamp') for c in read_items)):
+            c['time'] = t
+
+        self.metrics.count('rows_read', len(read_items))
+        return read_items
 
     def bulk_write(self, changes: List[dict]):
         """
         Truncate and replace table data with the provided list.
         """
-        with self._open_truncate() as wb:
+        with self.metrics.timer('write'), self._open_truncate() as wb:
             self.write_header(wb, 1)
             self._bulk_write(wb=wb, min_row=2, changes=changes, columns=self.COLUMN_KEYS)
 
+        self.metrics.count('rows_written', len(changes))
+
     def write_header(self, wb, row: int):
         """
         Re/creates table header (row number for header row is specified).
@@ -109,56 +151,89 @@ class Source:
         Open existing file. Use (or get) the old data and compare:
             - For updated entries, change row data (like_on, timestamp only)
             - For new entries (id not in the table), append to the end of table
-        """
-        with self._open_update() as wb:
 
-            # Read full current table with likes state to see if any needs update checkbox
-            cached_old_data = self.bulk_read(no_metadata=True) if not cached_old_data else cached_old_data
-
-            # Finds newest state per like id
-            def get_new_state(c):
-                for new in new_data:
-                    if new['artist_id'] == c['artist_id'] and new['album_id'] == c['album_id'] and new['track_id'] == c['track_id']:
-                        return new
-
-            # Aggregate rows that are missing
-            # Ensure not duplicating rows
-            def find_old_entry(c):
-                for old in cached_old_data:
-                    if all((old[k] == c[k] for k in ['artist_id', 'album_id', 'track_id'])):
-                        yield old
+        Writes are done per row, sources may join them within the open context (see XlsxSource, GoogleSheetSource).
+        The old data is read and compared before the table is opened for writes: 'write' metrics time only the writes.
+        """
+        # Read full current table with likes state to see if any needs update checkbox
+        cached_old_data = self.bulk_read(no_metadata=True) if not cached_old_data else cached_old_data
 
-            # Update likes on old changes (assume order is consistent)
-            num_old_rows = 2 + len(cached_old_data)
-            num_updated = 0
-            for i, c in enumerate(cached_old_data):
-                # For each of the existing table rows, get the updated state
-                new = get_new_state(c)
-                if not new:
-                    continue
+        with self.metrics.timer('diff'):
+            updated, appended, num_duplicates = self.merge_changes(cached_old_data, new_data)
 
-                # TODO: optimize by joining calls into one range
+        with self.metrics.timer('write'), self._open_update() as wb:
 
-                # For rows with updated like/timestamp, update the row
-                if c['like_on'] != new['like_on'] or c['timestamp'] != new['timestamp']:
-                    num_updated += 1
-                    logging.debug('Update row: %d', i+2)
-                    self._bulk_write(wb=wb, min_row=2+i, changes=[new], columns=['like_on', 'timestamp'])
+            # For rows with updated like/timestamp, update the row
+            for i, new in updated:
+                logging.debug('Update row: %d', i+2)
+                self._bulk_write(wb=wb, min_row=2+i, changes=[new], columns=self.UPDATE_KEYS)
 
-            logging.debug('Rows updated: %d', num_updated)
+            logging.debug('Rows updated: %d', len(updated))
 
             # The rest of changes are new likes
             # Write new table rows (assume metadata is present for new_data)
+            if appended:
+                num_old_rows = 2 + len(cached_old_data)
+                self._bulk_write(wb=wb, min_row=num_old_rows, changes=appended, columns=self.COLUMN_KEYS)
 
-            # Get the rows remainder
-            new_data = new_data[len(cached_old_data):]
-            if new_data:
-                # Safety: checks if remainder rows don't duplicate likes.
-                new_data = [c for c in new_data if not any(find_old_entry(c))]
+            logging.debug('Rows added: %d', len(appended))
+            logging.debug('Duplicate rows skipped: %d', num_duplicates)
 
-                # Write the remainder
-                self._bulk_write(wb=wb, min_row=num_old_rows, changes=new_data, columns=self.COLUMN_KEYS)
+        self.metrics.count('rows_written', len(updated) + len(appended))
 
-            logging.debug('Rows added: %d', len(new_data))
+    @classmethod
+    def merge_changes(cls, old_data: List[dict], new_data: List[dict]) -> Tuple[List[Tuple[int, dict]], List[dict], int]:
+        """
+        Compare new table state to the old table rows, matching rows by like key (see utility.like_key).
+        Row order does not matter.
+
+        Returns:
+            updated: list of (old row index, new entry) for rows with changed like_on/timestamp (UPDATE_KEYS)
+            appended: new entries not found in the old rows, in new_data order
+            num_duplicates: count of new entries skipped, as repeating a like already seen in new_data
+        """
+        # Newest state per like key, first entry wins
+        new_by_key = {}
+        num_duplicates = 0
+        for new in new_data:
+            key = like_key(new)
+            if key in new_by_key:
+                num_duplicates += 1
+                continue
+            new_by_key[key] = new
+
+        updated = []
+        old_keys = set()
+        for i, c in enumerate(old_data):
+            key = like_key(c)
+            old_keys.add(key)
+
+            new = new_by_key.get(key)
+            if new is None:
+                continue
+
+            if rows_diff(c, new, cls.UPDATE_KEYS):
+                updated.append((i, new))
+
+        appended = [new for key, new in new_by_key.items() if key not in old_keys]
+
+        return updated, appended, num_duplicates
+
+class SchemaSource(Source):
+    """
+    Base for sources with column names in a schema (database table, columnar file) instead of a header row.
+    Values are stored clean and typed (see _value), like_on as bool and other columns as str.
+    """
+
+    def write_header(self, wb, row: int):
+        # Column names are in the schema, no header row
+        pass
+
+    def _value(self, c: dict, key: str):
+        # Stored value of a dict field, missing as empty
+        if key == 'like_on':
+            return value_to_bool(c.get(key))
+        value = c.get(key)
+        return '' if value is None else str(value)
 
 # End
\ No newline at end of file
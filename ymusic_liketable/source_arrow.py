@@ -0,0 +1,188 @@
+import os
+from typing import Dict, Iterator, List
+from .source import SchemaSource
+from .like_row import LikeRow
+from .metrics import Metrics
+from .table_helper import TableHelper
+
+# Optional dependency, only needed for ArrowSource
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# ContextManager
+class ColumnsContext:
+    """
+    Table columns of a columnar file, as lists of values by key.
+
+    Columnar files are not updated in place: columns are loaded on first write (load callback),
+    changed in memory, and the whole file is written once on __exit__ (save callback).
+    """
+
+    def __init__(self, load, save, truncate: bool=False):
+        self._load = load
+        self._save = save
+        self.columns = {} if truncate else None
+        self.dirty = truncate
+
+    def __enter__(self) -> 'ColumnsContext':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Do not save partial changes on error
+        if self.dirty and exc_type is None:
+            self._save(self.columns)
+
+    def set_rows(self, index: int, rows: List[dict], keys: List[str], value):
+        """
+        Set keys of rows from 0-based row index, extending columns with empty values if needed.
+        value(c, key) gives the stored value.
+        """
+        if self.columns is None:
+            self.columns = self._load()
+        self.dirty = True
+
+        num_rows = max([len(v) for v in self.columns.values()] + [index + len(rows)])
+        for key in keys:
+            column = self.columns.setdefault(key, [])
+            column.extend([False if key == 'like_on' else ''] * (num_rows - len(column)))
+            for i, c in enumerate(rows):
+                column[index + i] = value(c, key)
+
+class ArrowSource(SchemaSource, TableHelper):
+    """
+    Read/Write likes as a columnar file: Parquet ('.parquet') or Arrow IPC (other extensions, e.g. '.arrow').
+
+    Text columns with few distinct values (artist, genres, genre) are dictionary-encoded.
+    Reads are memory-mapped and only load the columns needed (no_metadata: the five id/state columns).
+    bulk_read goes by record batch (READ_BATCH_SIZE rows), so only one batch at a time is converted to Python values.
+    Arrow IPC is written uncompressed, so memory-mapped reads are zero-copy.
+
+    Every write rewrites the whole file (atomically), meant for export/archival and analysis, e.g.:
+
+        ArrowSource('likes.parquet').bulk_write(XlsxSource(filename).bulk_read())
+
+    Requires pyarrow (optional dependency, extra 'arrow'): poetry install -E arrow
+    """
+
+    # Columns stored as dictionary (index into distinct values)
+    DICTIONARY_KEYS = ['artist', 'genres', 'genre']
+
+    # Rows per record batch, written to Arrow IPC and read from both formats
+    READ_BATCH_SIZE = 10000
+
+    def __init__(self, filename: str, metrics: Metrics=None):
+        """
+        Args:
+            filename: path to file, format by extension ('.parquet' or Arrow IPC)
+            metrics: timers and counters sink (see Metrics)
+        """
+        if pa is None:
+            raise ImportError('ArrowSource requires pyarrow: poetry install -E arrow')
+
+        self.filename = filename
+        self.parquet = filename.lower().endswith('.parquet')
+        if metrics:
+            self.metrics = metrics
+
+    def _read_batches(self, keys: List[str]) -> Iterator:
+        # Memory-mapped read of the columns (file columns only), as record batches
+        if not os.path.isfile(self.filename):
+            return
+
+        if self.parquet:
+            parquet_file = pq.ParquetFile(self.filename, memory_map=True)
+            names = parquet_file.schema_arrow.names
+            yield from parquet_file.iter_batches(batch_size=self.READ_BATCH_SIZE, columns=[k for k in keys if k in names])
+            return
+
+        with pa.memory_map(self.filename, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            names = reader.schema.names
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).select([k for k in keys if k in names])
+
+    def _read_columns(self, keys: List[str]) -> Dict[str, list]:
+        # Whole columns as lists (file columns only), for a rewrite of the file
+        columns = {}
+        for batch in self._read_batches(keys):
+            for key in batch.schema.names:
+                columns.setdefault(key, []).extend(batch.column(key).to_pylist())
+        return columns
+
+    def _write_columns(self, columns: Dict[str, list]):
+        num_rows = max([len(v) for v in columns.values()] + [0])
+
+        arrays = []
+        for key in self.COLUMN_KEYS:
+            values = columns.get(key, [])
+            values = values + [False if key == 'like_on' else ''] * (num_rows - len(values))
+            if key == 'like_on':
+                arrays.append(pa.array(values, pa.bool_()))
+            elif key in self.DICTIONARY_KEYS:
+                arrays.append(pa.array(values, pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, pa.string()))
+        table = pa.Table.from_arrays(arrays, names=self.COLUMN_KEYS)
+
+        # Readers see either the old or the new file
+        tmp_filename = self.filename + '.tmp'
+        if self.parquet:
+            pq.write_table(table, tmp_filename)
+        else:
+            with pa.OSFile(tmp_filename, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table, max_chunksize=self.READ_BATCH_SIZE)
+        os.replace(tmp_filename, self.filename)
+
+    def _open_truncate(self):
+        return ColumnsContext(lambda: self._read_columns(self.COLUMN_KEYS), self._write_columns, truncate=True)
+
+    def _open_update(self):
+        return ColumnsContext(lambda: self._read_columns(self.COLUMN_KEYS), self._write_columns)
+
+    def _bulk_read(self, wb, min_row: int, max_row: int, column_count: int) -> list:
+        """
+        Reads rows from min_row (to max_row if set) of the file, only the first column_count columns.
+        """
+        keys = self.COLUMN_KEYS[:column_count]
+
+        # Row 2 is the first row in file (row 1 is the header in tables), as 0-based file rows [start, end)
+        start = min_row - 2
+        end = max_row - 1 if max_row else None
+
+        offset = 0
+        for batch in self._read_batches(keys):
+            batch_start, offset = offset, offset + batch.num_rows
+            if offset <= start:
+                continue
+            if end is not None and batch_start >= end:
+                break
+
+            # Rows of the batch in [start, end), the only ones converted to Python values
+            first = max(start - batch_start, 0)
+            last = batch.num_rows if end is None else min(end - batch_start, batch.num_rows)
+            batch = batch.slice(first, last - first)
+            file_keys = batch.schema.names
+            values = [batch.column(k).to_pylist() for k in file_keys]
+
+            # Values are stored clean and typed (see _value), no read processors needed
+            for row in zip(*values):
+                c = LikeRow.fromkeys(keys, '')
+                for key, value in zip(file_keys, row):
+                    c[key] = value
+                yield c
+
+    def _bulk_write(self, wb, min_row: int, changes: list, columns: list):
+        """
+        Set the columns of rows from min_row, written to the file on context exit.
+        """
+        columns = [k for k in columns if k in self.COLUMN_KEYS]
+        wb.set_rows(min_row - 2, changes, columns, self._value)
+
+        self.metrics.count('cells_written', len(changes) * len(columns))
+
+# End
@@ -1,26 +1,126 @@
+import json
 import logging
 import gspread
 import gspread.utils
+import requests.exceptions
+from itertools import islice
 from typing import List, Union, Dict, Callable
 from .source import Source
-from .utility import iso_to_utc_timestamp
+from .like_row import LikeRow
 from .table_helper import TableHelper
-from gspread_formatting import DataValidationRule, BooleanCondition, set_data_validation_for_cell_range, set_frozen
+from .write_planner import WritePlanner
+from .metrics import Metrics
+from .request_scheduler import RequestScheduler
+from gspread.exceptions import APIError
+from gspread_formatting import DataValidationRule, BooleanCondition
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 
+def is_retryable_api_error(e: Exception) -> bool:
+    # Connection dropped or timed out (long runs on unstable networks)
+    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+
+    # Quota exceeded (429) or temporary server errors
+    return isinstance(e, APIError) and e.code in (429, 500, 502, 503, 504)
 
 # ContextManager
 class SpreadsheetContext:
+    """
+    Spreadsheet wrapper, delegates to gspread.Spreadsheet. Keeps the worksheet handle to work on.
+
+    With deferred_write, update_cells() only collects the cells, and all of them are sent
+    on __exit__ as contiguous ranges with few values:batchUpdate calls (see WritePlanner).
+
+    Sheet requests (clear, resize, header, validation, freeze) added with add_request() are collected
+    and sent as one spreadsheets.batchUpdate, before the next values write or on __exit__.
+    Writes are paced and retried by the scheduler.
+    """
     
-    def __init__(self, wb: gspread.Spreadsheet):
+    def __init__(self, wb: gspread.Spreadsheet, worksheet: gspread.Worksheet, deferred_write: bool=False, metrics: Metrics=None,
+                 scheduler: RequestScheduler=None, on_error: Callable[[], None]=None):
         self._wb = wb
+        self.worksheet = worksheet
+        self._planner = WritePlanner() if deferred_write else None
+        self._requests = []
+        self._metrics = metrics if metrics else Metrics()
+        self._scheduler = scheduler if scheduler else RequestScheduler(retryable=is_retryable_api_error, metrics=self._metrics)
+        self._on_error = on_error
 
-    def __enter__(self) -> gspread.Spreadsheet:
-        return self._wb
+    def __enter__(self) -> 'SpreadsheetContext':
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+        # Do not send partial changes on error
+        if exc_type is None:
+            self.flush()
+        elif self._on_error:
+            self._on_error()
+
+    def add_request(self, request: dict):
+        """
+        Collect a spreadsheets.batchUpdate request, e.g. {'updateSheetProperties': {...}}.
+        """
+        self._requests.append(request)
+
+    def flush_requests(self):
+        """
+        Send collected sheet requests, if any, with one spreadsheets.batchUpdate.
+        """
+        if not self._requests:
+            return
+
+        body = {'requests': self._requests}
+        self._metrics.count('api_calls', api='sheets', method='batch_update')
+        if self._metrics.enabled:
+            self._metrics.count('api_bytes', len(json.dumps(body, default=str)), api='sheets', direction='sent')
+        self._scheduler.call('write', self._wb.batch_update, body)
+
+        self._requests = []
+
+    def update_cells(self, cells: List[gspread.Cell]):
+        if self._planner is None:
+            self.flush_requests()
+            self._metrics.count('api_calls', api='sheets', method='update_cells')
+            if self._metrics.enabled:
+                self._metrics.count('api_bytes', len(json.dumps([c.value for c in cells], default=str)), api='sheets', direction='sent')
+            self._scheduler.call('write', self.worksheet.update_cells, cells)
+            return
+
+        self._planner.add_cells(cells)
+
+    def update_values(self, range_str: str, values: List[list]):
+        """
+        Send a block of values (rows of cell values) for A1 range right away, also with deferred_write:
+        such blocks are already big requests, collecting them would only hold them in memory.
+        """
+        self.flush_requests()
+
+        data = [{'range': range_str, 'values': values}]
+        self._metrics.count('api_calls', api='sheets', method='values_batch_update')
+        if self._metrics.enabled:
+            self._metrics.count('api_bytes', len(json.dumps(data, default=str)), api='sheets', direction='sent')
+        self._scheduler.call('write', self.worksheet.batch_update, data, raw=True)
+
+    def flush(self):
+        """
+        Send collected sheet requests and cells, if any.
+        """
+        self.flush_requests()
+
+        if not self._planner:
+            return
+
+        requests = self._planner.plan_requests()
+        logging.debug('Write %d cells with %d requests', len(self._planner), len(requests))
+
+        for data in requests:
+            self._metrics.count('api_calls', api='sheets', method='values_batch_update')
+            if self._metrics.enabled:
+                self._metrics.count('api_bytes', len(json.dumps(data, default=str)), api='sheets', direction='sent')
+            self._scheduler.call('write', self.worksheet.batch_update, data, raw=True)
+
+        self._planner.clear()
 
     def __getattr__(self, name):
         # Delegate attribute access to the wrapped workbook
@@ -29,9 +129,22 @@ class SpreadsheetContext:
 class GoogleSheetSource(Source, TableHelper):
     """
     Read/Write likes using Google Spreadsheet API and gspread.Client
+
+    The spreadsheet and its first worksheet are opened once, on first use, and reused by every bulk_* call
+    of this instance (one instance per sync run). Requests go through the gspread.Client HTTP session.
+    Call close() to open them again on next use, e.g. if the sheet was changed by other means.
+
+    All requests are paced under the Sheets per-minute quotas and retried on 429/5xx,
+    connection errors and timeouts (see RequestScheduler).
     """
 
-    def __init__(self, gc: gspread.Client, spreadsheet_url: str, refreshtoken_callback: Callable[[Credentials], None]=None):
+    # Requests counted against the read quota, others against the write quota
+    READ_METHODS = ('open_by_url', 'fetch_sheet_metadata', 'values_get')
+
+    # Whole rows per values request, when writing full rows (bulk_write, appended rows)
+    WRITE_CHUNK_ROWS = 1000
+
+    def __init__(self, gc: gspread.Client, spreadsheet_url: str, refreshtoken_callback: Callable[[Credentials], None]=None, deferred_write: bool=True, metrics: Metrics=None, scheduler: RequestScheduler=None, write_chunk_rows: int=None):
         """
         New instance init for a gspread table source (gets, saves data with google spreadsheet).
 
@@ -39,10 +152,30 @@ class GoogleSheetSource(Source, TableHelper):
             gc: gspread.Client (authorized/ready)
             spreadsheet_url: URL for the spreadsheet document to work on in this instance
             refreshtoken_callback: Function to call whenever refreshtoken has been updated by the API, to update credentials store
+            deferred_write: collect cell writes and send them joined into ranges when done (default), instead of a request per write
+            metrics: timers and counters sink (see Metrics)
+            scheduler: requests pacing and retries (default: Sheets quotas, retry on 429/5xx, connection errors and timeouts)
+            write_chunk_rows: rows per request when writing full rows (default WRITE_CHUNK_ROWS)
         """
         self.gc = gc
         self.spreadsheet_url = spreadsheet_url
         self.refreshtoken_callback = refreshtoken_callback
+        self.deferred_write = deferred_write
+        self.write_chunk_rows = write_chunk_rows if write_chunk_rows else self.WRITE_CHUNK_ROWS
+        if metrics:
+            self.metrics = metrics
+        self.scheduler = scheduler if scheduler else RequestScheduler(retryable=is_retryable_api_error, metrics=self.metrics)
+
+        # Opened spreadsheet and worksheet, for the whole session, and worksheet rows count including our resizes
+        self._spreadsheet = None
+        self._worksheet = None
+        self._row_count = 0
+
+    def _api(self, method: str, f: Callable=None, *args, **kwargs):
+        # Count API request in metrics, and make it with the scheduler (if f is given)
+        self.metrics.count('api_calls', api='sheets', method=method)
+        if f is not None:
+            return self.scheduler.call('read' if method in self.READ_METHODS else 'write', f, *args, **kwargs)
 
     def refresh_token_if_needed(self) -> bool:
         """
@@ -71,27 +204,44 @@ class GoogleSheetSource(Source, TableHelper):
 
         return False
 
-    def _open_truncate(self):
-        # For OAuth credentials, update refresh token if needed before using the API
+    def _open_session(self):
+        """
+        Spreadsheet and worksheet for this session, opened on first use.
+        """
+        # For OAuth credentials, update refresh token if needed before using the API (no request while valid)
         if hasattr(self.gc, 'auth'):
             self.refresh_token_if_needed()
 
-        wb = self.gc.open_by_url(self.spreadsheet_url)
+        if self._spreadsheet is None:
+            self._spreadsheet = self._api('open_by_url', self.gc.open_by_url, self.spreadsheet_url)
+            self._worksheet = self._api('fetch_sheet_metadata', lambda: self._spreadsheet.sheet1)
+            self._row_count = self._worksheet.row_count
+
+        return self._spreadsheet, self._worksheet
+
+    def close(self):
+        """
+        Forget opened spreadsheet and worksheet, next call opens them again.
+        """
+        self._spreadsheet = None
+        self._worksheet = None
+        self._row_count = 0
+
+    def _open_truncate(self):
+        wb, worksheet = self._open_session()
+        wb = SpreadsheetContext(wb, worksheet, deferred_write=self.deferred_write, metrics=self.metrics, scheduler=self.scheduler, on_error=self.close)
 
-        # Clear all cells content, remove all rows
+        # Clear all cells content (sent with header and resize requests, see write_header)
         logging.warn('Truncate/clear full worksheet')
-        wb.sheet1.clear()
+        wb.add_request({'updateCells': {'range': {'sheetId': worksheet.id}, 'fields': 'userEnteredValue'}})
 
-        return SpreadsheetContext(wb)
+        return wb
 
     def _open_update(self):
-        # For OAuth credentials, update refresh token if needed before using the API
-        if hasattr(self.gc, 'auth'):
-            self.refresh_token_if_needed()
+        wb, worksheet = self._open_session()
 
-        wb = self.gc.open_by_url(self.spreadsheet_url)
-
-        return SpreadsheetContext(wb)
+        # On error the sheet state is unknown (e.g. resize not sent), open again on next use
+        return SpreadsheetContext(wb, worksheet, deferred_write=self.deferred_write, metrics=self.metrics, scheduler=self.scheduler, on_error=self.close)
 
     def _bulk_read(self, wb, min_row: int, max_row: int=None, column_count: int=None) -> list:
         """
@@ -101,54 +251,93 @@ class GoogleSheetSource(Source, TableHelper):
         # Per each row, define how each cell value is post-processed (func) using a key in 'processors' 
         processors = self.get_read_processors()
 
-        worksheet = wb.sheet1
+        worksheet = wb.worksheet
 
         logging.debug(min_row)
-        if worksheet.row_count < min_row:
+        if self._row_count < min_row:
             return
 
-        max_row = max_row if max_row else worksheet.row_count
+        # Open-ended range (no max row) returns up to the last used row only, not the allocated row_count
         column_count = column_count if column_count else len(self.COLUMN_KEYS)
         end_col_letter = gspread.utils.rowcol_to_a1(1, column_count)[0]
         range_str = f"A{min_row}:{end_col_letter}{max_row if max_row else ''}"
 
+        # Column-major response: one list per column, no per-row list overhead in JSON
+        columns = self._api('values_get', worksheet.get, range_str, major_dimension='COLUMNS')
+        if self.metrics.enabled:
+            self.metrics.count('api_bytes', len(json.dumps(columns, default=str)), api='sheets', direction='received')
+
+        # Each column is trimmed of trailing empty cells separately, pad to the longest
+        num_rows = max((len(col) for col in columns), default=0)
+        columns = [list(col) + [''] * (num_rows - len(col)) for col in columns]
+
+        # Empty rows seen after the last non-empty row
+        empty_rows = []
+
         # Read every row in range and return rows as key-value dicts
-        for row in worksheet.get(range_str):
+        for row in zip(*columns):
 
             # Empty key-value for each column
-            c = {k: '' for k in self.COLUMN_KEYS[:column_count]}
+            c = LikeRow.fromkeys(self.COLUMN_KEYS[:column_count], '')
 
             # Fill with cell data and post-processed values
             for idx, value in enumerate(row):
                 key = self.COLUMN_KEYS[idx]
                 c[key] = processors[key](value)
 
-            # Add unix time 'time' key to the each element
-            timestamp = c.get('timestamp')
-            c['time'] = iso_to_utc_timestamp(timestamp) if timestamp else 0
-
-            # Break on full empty row
+            # Rows are matched to table rows by position (see Source.bulk_update): keep empty rows
+            # in the middle of the table, only skip the trailing ones (e.g. unchecked checkboxes only)
             if all(not v for v in c.values()):
-                break
-            
+                empty_rows.append(c)
+                continue
+
+            yield from empty_rows
+            empty_rows = []
+
             yield c
     
-    def write_header(self, wb, row: int):
-        super().write_header(wb, row)
+    @classmethod
+    def _resize_request(cls, worksheet: gspread.Worksheet, rows: int) -> dict:
+        return {'updateSheetProperties': {
+            'properties': {'sheetId': worksheet.id, 'gridProperties': {'rowCount': rows}},
+            'fields': 'gridProperties.rowCount',
+        }}
 
-        sh = wb.sheet1
+    def write_header(self, wb, row: int):
+        """
+        Header row values, checkbox column and frozen header as sheet requests,
+        sent together with clear and resize as one spreadsheets.batchUpdate.
+        """
+        sh = wb.worksheet
 
         logging.info('Create spreadsheet header row and checkbox column')
 
+        if self._row_count < row + 1:
+            wb.add_request(self._resize_request(sh, row + 1))
+            self._row_count = row + 1
+
+        # Header values
+        wb.add_request({'updateCells': {
+            'start': {'sheetId': sh.id, 'rowIndex': row - 1, 'columnIndex': 0},
+            'rows': [{'values': [{'userEnteredValue': {'stringValue': k}} for k in self.COLUMN_KEYS]}],
+            'fields': 'userEnteredValue',
+        }})
+
         # Define the checkbox data validation rule to make checkbox column
         checkbox_rule = DataValidationRule(
             BooleanCondition('BOOLEAN', ['TRUE', 'FALSE']),
             showCustomUi=True
         )
-        set_data_validation_for_cell_range(sh, f'A{row+1}:A', checkbox_rule)
+        wb.add_request({'setDataValidation': {
+            'range': gspread.utils.a1_range_to_grid_range(f'A{row+1}:A', sh.id),
+            'rule': checkbox_rule.to_props(),
+        }})
 
         # Header row always visible
-        set_frozen(sh, rows=row)
+        wb.add_request({'updateSheetProperties': {
+            'properties': {'sheetId': sh.id, 'gridProperties': {'frozenRowCount': row}},
+            'fields': 'gridProperties.frozenRowCount',
+        }})
 
     def _bulk_write(self, wb, min_row: int, changes: list, columns: list):
         """
@@ -157,7 +346,20 @@ class GoogleSheetSource(Source, TableHelper):
         """
         processors = self.get_write_processors(columns)
 
-        worksheet = wb.sheet1
+        worksheet = wb.worksheet
+
+        # Resize once if needed before write (sent with the next write)
+        desired_rows = min_row + len(changes)
+        if self._row_count < desired_rows:
+            wb.add_request(self._resize_request(worksheet, desired_rows))
+            self._row_count = desired_rows
+
+        logging.debug('Min row=%d', min_row)
+
+        # Full rows: stream 2D value arrays in chunks of rows, no object per cell
+        if columns == self.COLUMN_KEYS:
+            self._bulk_write_rows(wb, min_row, changes, processors)
+            return
 
         # Create flat arrays from dicts
         def cell_updates():
@@ -166,21 +368,37 @@ class GoogleSheetSource(Source, TableHelper):
                 for k in columns:
                     if k in c and k in self.COLUMN_KEYS:
                         value = processors[k](c[k])
-                        column_index = self.COLUMN_KEYS.index(k) + 1
-                        yield gspread.Cell(row, column_index, value)
+                        yield gspread.Cell(row, self.column_index(k), value)
                 row += 1
 
         data = list(cell_updates())
 
-        # Resize if needed before write
-        desired_rows = min_row + len(changes)
-        if worksheet.row_count < desired_rows:
-            desired_cols = worksheet.col_count
-            worksheet.resize(rows=desired_rows, cols=desired_cols)
-
-        logging.debug('Min row=%d', min_row)
         logging.debug('data len=%d', len(data))
 
+        self.metrics.count('cells_written', len(data))
+
         if data:
-            worksheet.update_cells(data)
+            wb.update_cells(data)
+
+    def _bulk_write_rows(self, wb, min_row: int, changes: list, processors: dict):
+        """
+        Write full rows from min_row, write_chunk_rows rows per request. Only one chunk of values is in memory.
+        """
+        end_col_letter = gspread.utils.rowcol_to_a1(1, len(self.COLUMN_KEYS))[0]
+
+        # Rows of cell values from dicts, missing keys as empty cells
+        def value_rows():
+            for c in changes:
+                yield [processors[k](c[k]) if k in c else '' for k in self.COLUMN_KEYS]
+
+        row = min_row
+        rows = value_rows()
+        while True:
+            chunk = list(islice(rows, self.write_chunk_rows))
+            if not chunk:
+                break
+
+            wb.update_values(f"A{row}:{end_col_letter}{row + len(chunk) - 1}", chunk)
+            self.metrics.count('cells_written', len(chunk) * len(self.COLUMN_KEYS))
+            row += len(chunk)
 
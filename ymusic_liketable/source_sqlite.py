@@ -0,0 +1,197 @@
+import logging
+import sqlite3
+from typing import List
+from .utility import like_key, like_entity
+from .source import SchemaSource
+from .like_row import LikeRow
+from .metrics import Metrics
+from .table_helper import TableHelper
+
+# ContextManager
+class ConnectionContext:
+    """
+    SQLite connection wrapper, delegates to sqlite3.Connection.
+
+    All statements in the context are one transaction: committed on __exit__, rolled back on error.
+    With truncate, all rows are deleted first (in the same transaction).
+    """
+
+    def __init__(self, db: sqlite3.Connection, truncate: bool=False):
+        self._db = db
+        self._truncate = truncate
+
+    def __enter__(self) -> 'ConnectionContext':
+        self._db.execute('BEGIN')
+        if self._truncate:
+            self._db.execute('DELETE FROM likes')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # Do not keep partial changes on error
+            if exc_type is None:
+                self._db.commit()
+            else:
+                self._db.rollback()
+        finally:
+            self._db.close()
+
+    def __getattr__(self, name):
+        # Delegate attribute access to the wrapped connection
+        return getattr(self._db, name)
+
+class SqliteSource(SchemaSource, TableHelper):
+    """
+    Read/Write likes in a local SQLite file: table 'likes' with the table columns, and 'row' as the table row number.
+
+    Rows are unique by like key (see utility.like_key), stored in column 'like_key' with an index, so bulk_update
+    is a few executemany statements (update checkboxes by like key, insert new rows) in one transaction.
+    Rows without ids have no like key (NULL, not indexed), so empty rows are kept in place like in the other sources.
+    like_on is stored as 0/1 (sqlite3 binds bool as integer).
+    Meant as a fast primary store, to export to XLSX/Google Sheets when needed:
+
+        XlsxSource(filename).bulk_write(SqliteSource(filename).bulk_read())
+    """
+
+    # Rows per executemany batch, bounds memory for big writes
+    WRITE_BATCH_SIZE = 5000
+
+    def __init__(self, filename: str, metrics: Metrics=None):
+        """
+        Args:
+            filename: path to SQLite file (created if needed)
+            metrics: timers and counters sink (see Metrics)
+        """
+        self.filename = filename
+        if metrics:
+            self.metrics = metrics
+
+    def _connect(self) -> sqlite3.Connection:
+        # Transactions are explicit (see ConnectionContext)
+        db = sqlite3.connect(self.filename, isolation_level=None)
+        columns = ', '.join(
+            '%s INTEGER NOT NULL DEFAULT 0' % k if k == 'like_on' else "%s TEXT NOT NULL DEFAULT ''" % k
+            for k in self.COLUMN_KEYS
+        )
+        db.execute('CREATE TABLE IF NOT EXISTS likes (row INTEGER PRIMARY KEY, %s, like_key TEXT)' % columns)
+
+        # Files of the first version: unique by the ids triple, no like key column
+        if 'like_key' not in [info[1] for info in db.execute('PRAGMA table_info(likes)')]:
+            self._add_like_key(db)
+
+        db.execute('CREATE UNIQUE INDEX IF NOT EXISTS likes_like_key ON likes (like_key)')
+        return db
+
+    def _add_like_key(self, db: sqlite3.Connection):
+        # Add and fill the like key column in one transaction. Rows repeating a like key of another row are kept, without a key
+        db.execute('BEGIN')
+        try:
+            db.execute('DROP INDEX IF EXISTS likes_ids')
+            db.execute('ALTER TABLE likes ADD COLUMN like_key TEXT')
+            db.execute('CREATE UNIQUE INDEX likes_like_key ON likes (like_key)')
+            rows = db.execute('SELECT row, artist_id, album_id, track_id FROM likes ORDER BY row').fetchall()
+            db.executemany(
+                'UPDATE OR IGNORE likes SET like_key = ? WHERE row = ?',
+                ((self._like_key(dict(artist_id=a, album_id=b, track_id=t)), row) for row, a, b, t in rows)
+            )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+    @classmethod
+    def _like_key(cls, c: dict) -> str:
+        # Stored like key, e.g. 'tracks:123'. None for a row without ids
+        entity = like_entity(c)
+        if not entity:
+            return None
+        return '%s:%s' % (entity, ''.join(str(i) for i in like_key(c)))
+
+    def _open_truncate(self):
+        return ConnectionContext(self._connect(), truncate=True)
+
+    def _open_update(self):
+        return ConnectionContext(self._connect())
+
+    def _bulk_read(self, wb, min_row: int, max_row: int, column_count: int) -> list:
+        """
+        Reads rows from min_row (to max_row if set) in row order.
+        """
+        processors = self.get_read_processors()
+        keys = self.COLUMN_KEYS[:column_count]
+
+        query = 'SELECT %s FROM likes WHERE row >= ?' % ', '.join(keys)
+        params = [min_row]
+        if max_row:
+            query += ' AND row <= ?'
+            params.append(max_row)
+
+        for values in wb.execute(query + ' ORDER BY row', params):
+            c = LikeRow.fromkeys(keys, '')
+            for key, value in zip(keys, values):
+                c[key] = processors[key](value)
+            yield c
+
+    def _bulk_write(self, wb, min_row: int, changes: list, columns: list):
+        """
+        Upserts rows from min_row: the given columns are updated for existing row numbers, other rows are inserted.
+        Rows repeating the like key of another row are skipped. The like key is rewritten if ids are written.
+
+        Update then insert (both OR IGNORE), not INSERT ... ON CONFLICT: an upsert skipping duplicate ids needs
+        two ON CONFLICT clauses, which need SQLite 3.35 (older SQLite of Python 3.9 builds fails with a syntax error).
+        """
+        columns = [k for k in columns if k in self.COLUMN_KEYS]
+        with_key = any(k in columns for k in ('artist_id', 'album_id', 'track_id'))
+        stored = columns + ['like_key'] if with_key else columns
+        update_query = 'UPDATE OR IGNORE likes SET %s WHERE row = ?' % ', '.join('%s = ?' % k for k in stored)
+        insert_query = 'INSERT OR IGNORE INTO likes (row, %s) VALUES (?%s)' % (', '.join(stored), ', ?' * len(stored))
+
+        num_before = wb.total_changes
+        for n in range(0, len(changes), self.WRITE_BATCH_SIZE):
+            part = changes[n:n+self.WRITE_BATCH_SIZE]
+            values = [[self._value(c, k) for k in columns] + ([self._like_key(c)] if with_key else []) for c in part]
+            wb.executemany(update_query, (v + [min_row + n + i] for i, v in enumerate(values)))
+            # Rows updated above are already there, ignored
+            wb.executemany(insert_query, ([min_row + n + i] + v for i, v in enumerate(values)))
+
+        num_written = wb.total_changes - num_before
+        if num_written < len(changes):
+            logging.warning('Rows with duplicate like keys skipped: %d', len(changes) - num_written)
+
+        self.metrics.count('cells_written', num_written * len(columns))
+
+    def bulk_update(self, new_data: List[dict], cached_old_data: List[dict]=None):
+        """
+        Same as Source.bulk_update, with two statements: update like_on/timestamp by like key (unique index), insert new rows.
+        """
+        # Read full current table with likes state to see if any needs update checkbox
+        cached_old_data = self.bulk_read(no_metadata=True) if not cached_old_data else cached_old_data
+
+        with self.metrics.timer('diff'):
+            updated, appended, num_duplicates = self.merge_changes(cached_old_data, new_data)
+
+        with self.metrics.timer('write'), self._open_update() as wb:
+
+            # For rows with updated like/timestamp, update the row found by its like key
+            wb.executemany(
+                'UPDATE likes SET like_on = ?, timestamp = ? WHERE like_key = ?',
+                (
+                    [self._value(new, 'like_on'), self._value(new, 'timestamp'), self._like_key(cached_old_data[i])]
+                    for i, new in updated
+                )
+            )
+            self.metrics.count('cells_written', len(updated) * 2)
+
+            logging.debug('Rows updated: %d', len(updated))
+
+            # The rest of changes are new likes, after the last row
+            if appended:
+                last_row = wb.execute('SELECT MAX(row) FROM likes').fetchone()[0]
+                self._bulk_write(wb=wb, min_row=(last_row if last_row else 1) + 1, changes=appended, columns=self.COLUMN_KEYS)
+
+            logging.debug('Rows added: %d', len(appended))
+            logging.debug('Duplicate rows skipped: %d', num_duplicates)
+
+        self.metrics.count('rows_written', len(updated) + len(appended))
+
+# End
@@ -1,66 +1,204 @@
 import os
 from openpyxl import load_workbook, Workbook
-from .utility import iso_to_utc_timestamp, strip_trailing_dot_zero, value_to_bool
+from .utility import strip_trailing_dot_zero, value_to_bool
 from .source import Source
+from .like_row import LikeRow
+from .metrics import Metrics
 from .table_helper import TableHelper
+from .table_sidecar import TableSidecar, SidecarContext
 
 # ContextManager
 class WorkbookContext:
+    """
+    Workbook wrapper, delegates to openpyxl Workbook.
+
+    With deferred_save, save() only remembers the filename and the workbook is saved once on __exit__,
+    so that many writes in one context cost one serialization.
+
+    on_saved(context) is called on __exit__ if the workbook was saved without error (e.g. to update the sidecar).
+    """
     
-    def __init__(self, wb):
+    def __init__(self, wb, deferred_save: bool=False, fingerprint: tuple=None, on_saved=None):
         self._wb = wb
+        self._deferred_save = deferred_save
+        self._save_filename = None
+        self._saved = False
+        self._on_saved = on_saved
+
+        # Fingerprint of the file before any write (read: to save the parsed rows in sidecar for it)
+        self.fingerprint = fingerprint
+
+        # Writes done in this context as (min_row, changes, columns), see XlsxSource._bulk_write
+        self.writes = []
 
-    def __enter__(self) -> Workbook:
-        return self._wb
+        # Next row of a write-only worksheet, rows can only be appended
+        self.next_row = 1
+
+    def __enter__(self) -> 'WorkbookContext':
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._wb.close()
+        try:
+            # Do not save partial changes on error
+            if self._save_filename and exc_type is None:
+                self._wb.save(self._save_filename)
+                self._saved = True
+        finally:
+            self._wb.close()
+
+        if self._saved and self._on_saved and exc_type is None:
+            self._on_saved(self)
+
+    def save(self, filename: str):
+        if self._deferred_save:
+            self._save_filename = filename
+        else:
+            self._wb.save(filename)
+            self._saved = True
 
     def __getattr__(self, name):
         # Delegate attribute access to the wrapped workbook
         return getattr(self._wb, name)
 
 class XlsxSource(Source, TableHelper):
+    """
+    Read/Write likes in a local XLSX file with openpyxl.
+
+    Parsed rows of a full read are kept in a binary sidecar file next to it (filename + '.cache', see TableSidecar).
+    Reads of the unchanged file (same size, mtime and content hash) load the sidecar instead of parsing the file.
+    Writes update the sidecar for the saved file (see _update_sidecar), so the next read after a write is a hit too.
+    """
 
-    def __init__(self, filename: str):
+    # Sidecar filename suffix
+    SIDECAR_SUFFIX = '.cache'
+
+    def __init__(self, filename: str, deferred_save: bool=True, write_only: bool=True, sidecar: bool=True, metrics: Metrics=None):
+        """
+        Args:
+            filename: path to XLSX file
+            deferred_save: save the file once when done with writes (default), instead of after every write
+            write_only: recreate the file (bulk_write) with a write-only workbook, rows streamed to disk
+                instead of kept in memory as cells (default, needs deferred_save: saved once)
+            sidecar: read unchanged file from the parsed rows cache (default)
+            metrics: timers and counters sink (see Metrics)
+        """
         self.filename = filename
+        self.deferred_save = deferred_save
+        self.write_only = write_only and deferred_save
+        self.sidecar = TableSidecar(filename + self.SIDECAR_SUFFIX) if sidecar else None
+        if metrics:
+            self.metrics = metrics
 
     def _open_truncate(self):
-        return WorkbookContext(Workbook())
+        on_saved = (lambda wb: self._update_sidecar(wb, truncate=True)) if self.sidecar else None
+        if self.write_only:
+            # Write-only workbook has no sheet until created
+            wb = Workbook(write_only=True)
+            wb.create_sheet()
+            return WorkbookContext(wb, deferred_save=True, on_saved=on_saved)
+        return WorkbookContext(Workbook(), deferred_save=self.deferred_save, on_saved=on_saved)
 
     def _open_update(self):
+        fingerprint = None
         if os.path.isfile(self.filename):
+            if self.sidecar:
+                fingerprint = TableSidecar.fingerprint(self.filename)
             wb = load_workbook(self.filename, data_only=False)
         else:
             wb = Workbook()
-        return WorkbookContext(wb)
+        on_saved = (lambda wb: self._update_sidecar(wb, truncate=False)) if self.sidecar else None
+        return WorkbookContext(wb, deferred_save=self.deferred_save, fingerprint=fingerprint, on_saved=on_saved)
+
+    def _open_read(self):
+        if not os.path.isfile(self.filename):
+            return WorkbookContext(Workbook())
+
+        # Unchanged file since the last full read: rows from the sidecar, file is not opened
+        fingerprint = None
+        if self.sidecar:
+            fingerprint = TableSidecar.fingerprint(self.filename)
+            columns = self.sidecar.load(fingerprint)
+            if columns is not None and all(k in columns for k in self.COLUMN_KEYS):
+                self.metrics.count('sidecar_reads', status='hit')
+                return SidecarContext(columns)
+            self.metrics.count('sidecar_reads', status='miss')
+
+        # Read only mode streams rows from the file instead of loading all cells in memory
+        wb = load_workbook(self.filename, read_only=True, data_only=False)
+        return WorkbookContext(wb, fingerprint=fingerprint)
 
     def _bulk_read(self, wb, min_row: int, max_row: int, column_count: int) -> list:
         """
         Reads Excel file with changes library.
         Each row describes an artist, album or track. Like is a checkbox.
         """
+        keys = self.COLUMN_KEYS[:column_count]
+
+        if isinstance(wb, SidecarContext):
+            # Row 2 is the first row of data (row 1 is the header)
+            start = min_row - 2
+            end = max_row - 1 if max_row else None
+            for row in zip(*[wb.columns[k][start:end] for k in keys]):
+                c = LikeRow()
+                for key, value in zip(keys, row):
+                    setattr(c, key, value)
+                yield c
+            return
+
+        # Full read of the file is saved to the sidecar, as columns of processed values
+        save_sidecar = wb.fingerprint is not None and min_row == 2 and max_row is None and keys == self.COLUMN_KEYS
+        columns = {k: [] for k in keys}
+
         # Per each row, define how each cell value is post-processed (func) using a key in 'processors' 
         processors = self.get_read_processors()
         
         ws = wb.active
 
-        # Read every row in range and return rows as key-value dicts
-        for row in ws.iter_rows(min_row=min_row, max_row=max_row, max_col=column_count):
+        # Stored dimensions may be wrong for files written by other apps, read until the end in read only mode
+        if hasattr(ws, 'reset_dimensions'):
+            ws.reset_dimensions()
+
+        # Empty rows seen after the last non-empty row
+        num_empty = 0
+
+        # Read every row in range as values and return rows as key-value dicts
+        for row in ws.iter_rows(min_row=min_row, max_row=max_row, max_col=column_count, values_only=True):
+
+            # Rows are matched to table rows by position (see Source.bulk_update): keep empty rows
+            # in the middle of the table, only skip the trailing ones (e.g. cleared or formatted only)
+            if all(v is None or v == '' for v in row):
+                num_empty += 1
+                continue
+
+            for _ in range(num_empty):
+                yield self._read_row(None, processors, column_count, columns if save_sidecar else None)
+            num_empty = 0
+
+            yield self._read_row(row, processors, column_count, columns if save_sidecar else None)
+
+        if save_sidecar:
+            self.sidecar.save(wb.fingerprint, columns)
+
+    def _read_row(self, row: tuple, processors: dict, column_count: int, columns: dict=None) -> LikeRow:
+        """
+        Row values (None for an empty row) as key-value dict of post-processed values.
+        Values are also appended to columns (by key) if given.
+        """
+        row = row if row else (None,) * column_count
+
+        # Empty key-value for each column
+        c = LikeRow.fromkeys(self.COLUMN_KEYS[:column_count], '')
 
-            # Empty key-value for each column
-            c = {k: '' for k in self.COLUMN_KEYS[:column_count]}
+        # Fill with cell data and post-processed values
+        for idx, value in enumerate(row[:column_count]):
+            key = self.COLUMN_KEYS[idx]
+            c[key] = processors[key](value)
 
-            # Fill with cell data and post-processed values
-            for idx, cell in enumerate(row):
-                key = self.COLUMN_KEYS[idx]
-                c[key] = processors[key](cell.value)
+        if columns is not None:
+            for key in columns:
+                columns[key].append(c[key])
 
-            # Add unix time 'time' key to the each element
-            timestamp = c.get('timestamp')
-            c['time'] = iso_to_utc_timestamp(timestamp) if timestamp else 0
-            
-            yield c
+        return c
 
     def _bulk_write(self, wb, min_row: int, changes: list, columns: list):
         """
@@ -73,14 +211,108 @@ class XlsxSource(Source, TableHelper):
         
         ws = wb.active
 
+        # Remembered to apply the same changes to the sidecar once saved
+        wb.writes.append((min_row, changes, columns))
+
+        if wb.write_only:
+            # Rows can only be appended: min_row must be the next row of the worksheet
+            if min_row != wb.next_row:
+                raise ValueError('Write-only worksheet can only append at row %d, not %d' % (wb.next_row, min_row))
+            self._bulk_append(ws, changes, columns, processors)
+            wb.next_row += len(changes)
+            wb.save(self.filename)
+            return
+
         # Write the changes
+        num_cells = 0
         for i, c in enumerate(changes):
-            for column, key in enumerate(columns):
+            for key in columns:
                 if not key in c:
                     continue
                 value = processors[key](c[key])
-                ws.cell(row=min_row+i, column=column+1, value=value)
+                ws.cell(row=min_row+i, column=self.column_index(key), value=value)
+                num_cells += 1
+
+        self.metrics.count('cells_written', num_cells)
 
         wb.save(self.filename)
 
+    def _bulk_append(self, ws, changes: list, columns: list, processors: dict):
+        """
+        Append rows to a write-only worksheet, after the rows already appended (header, then data).
+        Each row is streamed to the file, no cells kept in memory.
+        """
+        # Full rows, in table column order
+        def rows():
+            for c in changes:
+                yield [processors[key](c[key]) if key in columns and key in c else None for key in self.COLUMN_KEYS]
+
+        num_rows = 0
+        for row in rows():
+            ws.append(row)
+            num_rows += 1
+
+        self.metrics.count('cells_written', num_rows * len(columns))
+
+    def _update_sidecar(self, wb: WorkbookContext, truncate: bool):
+        """
+        Save the sidecar for the file just saved: the rows as a full read of it would parse them.
+
+        Truncate: rows are the ones written. Update: writes are applied to the sidecar of the file before them,
+        if it matched (else the next read parses the file and saves the sidecar).
+        """
+        if truncate:
+            columns = {k: [] for k in self.COLUMN_KEYS}
+        else:
+            columns = self.sidecar.load(wb.fingerprint) if wb.fingerprint is not None else None
+            if columns is None or not all(k in columns for k in self.COLUMN_KEYS):
+                return
+
+        columns = self._apply_writes(columns, wb.writes)
+        if columns is None:
+            return
+
+        self.sidecar.save(TableSidecar.fingerprint(self.filename), columns)
+        self.metrics.count('sidecar_writes')
+
+    def _apply_writes(self, columns: dict, writes: list) -> dict:
+        """
+        Apply writes (min_row, changes, columns) to sidecar columns, values post-processed like on read.
+
+        Returns:
+            columns, or None if the last row may be read as empty (then it is not read, see _bulk_read).
+        """
+        write_processors = self.get_write_processors(self.COLUMN_KEYS)
+        read_processors = self.get_read_processors()
+
+        # Values of a row with empty cells
+        empty = self._read_row(None, read_processors, len(self.COLUMN_KEYS))
+
+        num_rows = len(columns[self.COLUMN_KEYS[0]])
+        for min_row, changes, keys in writes:
+            for i, c in enumerate(changes):
+                # Row 2 is the first row of data (row 1 is the header)
+                index = min_row + i - 2
+                if index < 0:
+                    continue
+
+                # Rows skipped by the write are empty
+                while num_rows <= index:
+                    for key in self.COLUMN_KEYS:
+                        columns[key].append(empty[key])
+                    num_rows += 1
+
+                for key in keys:
+                    if not key in c:
+                        continue
+                    # Empty string is not kept in a cell, it is read back as an empty cell
+                    value = write_processors[key](c[key])
+                    columns[key][index] = read_processors[key](None if value == '' else value)
+
+        # Empty rows at the end are not read, and a row of empty values may have empty cells
+        if num_rows and all(columns[key][-1] == empty[key] for key in self.COLUMN_KEYS):
+            return None
+
+        return columns
+
 # End
\ No newline at end of file
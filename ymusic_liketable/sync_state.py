@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Iterable, List
+from .utility import like_entity
+
+class SyncState:
+    """
+    Persisted state of the last sync run (JSON file): API time, table rows count and checksum.
+    For entity types with a library revision (tracks), also the revision and liked ids, to skip the download when it is the same.
+
+    Next run, after reading the table and the likes online, compares:
+        - library revision, before the download (see Liketable.get_online_data): the only check done before a download,
+          liked albums and artists have no revision and are always downloaded
+        - online liked ids per entity type with liked rows of the table read, for likes changed in the app (see changed_entities)
+        - table rows count and checksum, for checkboxes changed in the table (see table_changed)
+
+    Nothing changed -> the run skips import, upload and table write (see is_unchanged).
+    The state is only valid for the same table: for an empty (new, replaced) table, do not use it.
+    """
+
+    VERSION = 1
+
+    ENTITIES = ['artists', 'albums', 'tracks']
+
+    # Liked ids sets in online_data, by entity type
+    ONLINE_IDS_KEYS = {'artists': 'artist_ids', 'albums': 'album_ids', 'tracks': 'track_ids'}
+
+    # Table row id column, by entity type
+    ID_KEYS = {'artists': 'artist_id', 'albums': 'album_id', 'tracks': 'track_id'}
+
+    def __init__(self, filename: str):
+        """
+        Args:
+            filename: path to JSON file (loaded if exists)
+        """
+        self.filename = filename
+        self.state = {}
+
+        if os.path.isfile(filename):
+            with open(filename, 'r') as f:
+                state = json.load(f)
+
+            # Other format version: start over
+            if state.get('version') == self.VERSION:
+                self.state = state
+            else:
+                logging.info('Sync state version changed, ignoring: %s', filename)
+
+    @classmethod
+    def table_liked_ids(cls, table_data: List[dict]) -> Dict[str, set]:
+        """
+        Liked ids per entity type in table data, by like key.
+        """
+        ids = {k: set() for k in cls.ENTITIES}
+        for c in table_data:
+            entity = like_entity(c)
+            if c['like_on'] and entity:
+                ids[entity].add(c[cls.ID_KEYS[entity]])
+        return ids
+
+    @classmethod
+    def table_checksum(cls, table_data: List[dict]) -> str:
+        """
+        Checksum of ids, like_on and timestamp of table rows (in any order).
+        """
+        digests = sorted(
+            '%s|%s|%s|%d|%s' % (c['artist_id'] or '', c['album_id'] or '', c['track_id'] or '', bool(c['like_on']), c['timestamp'] or '')
+            for c in table_data
+        )
+        return hashlib.sha1('\n'.join(digests).encode()).hexdigest()
+
+    def revision(self, entity: str) -> int:
+        """
+        Library revision of the last sync for entity type, None if unknown.
+        """
+        return self.state.get('likes', {}).get(entity, {}).get('revision')
+
+    def liked_ids(self, entity: str) -> set:
+        """
+        Liked ids of the last sync for entity type (kept only with a revision).
+        """
+        return set(self.state.get('likes', {}).get(entity, {}).get('ids', []))
+
+    def changed_entities(self, online_data: dict, table_data: List[dict]) -> List[str]:
+        """
+        Entity types with liked ids online different from liked rows in the table (as read now, not as of the last sync).
+        """
+        liked_ids = self.table_liked_ids(table_data)
+        return [k for k in self.ENTITIES if liked_ids[k] != set(online_data[self.ONLINE_IDS_KEYS[k]])]
+
+    def table_changed(self, table_data: List[dict]) -> bool:
+        """
+        Table rows differ from the last sync.
+        """
+        table = self.state.get('table', {})
+        return table.get('rows') != len(table_data) or table.get('checksum') != self.table_checksum(table_data)
+
+    def revisions_changed(self, online_data: dict) -> bool:
+        """
+        Library revisions online differ from the last sync (e.g. moved with our own uploaded changes),
+        state is worth saving even if nothing else changed.
+        """
+        return any(self.revision(k) != v for k, v in online_data.get('revisions', {}).items())
+
+    def is_unchanged(self, online_data: dict, table_data: List[dict]) -> bool:
+        """
+        Nothing to sync: no likes changed in the app nor in the table since the last sync.
+        """
+        return not self.changed_entities(online_data, table_data) and not self.table_changed(table_data)
+
+    def update(self, online_data: dict, table_data: List[dict]):
+        """
+        Remember state after sync: table_data as written to the table.
+        """
+        liked_ids = self.table_liked_ids(table_data)
+        revisions = online_data.get('revisions', {})
+
+        likes = {}
+        for k in self.ENTITIES:
+            # Revision is valid only if online likes are the same as in the table
+            if revisions.get(k) and liked_ids[k] == online_data[self.ONLINE_IDS_KEYS[k]]:
+                likes[k] = {'revision': revisions[k], 'ids': sorted(liked_ids[k])}
+
+        self.state = {
+            'version': self.VERSION,
+            'time': online_data['time'],
+            'timestamp': online_data['timestamp'],
+            'likes': likes,
+            'table': {'rows': len(table_data), 'checksum': self.table_checksum(table_data)},
+        }
+
+    def save(self):
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_filename, self.filename)
+
+# End
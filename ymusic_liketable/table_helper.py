@@ -1,6 +1,7 @@
 import re
 from typing import List
 from .utility import iso_to_utc_timestamp, strip_trailing_dot_zero, value_to_bool
+from .like_row import LikeRow
 
 class TableHelper:
     """
@@ -46,6 +47,14 @@ class TableHelper:
 
         return processors
 
+    @classmethod
+    def snapshot(cls, table_data: List[LikeRow]) -> List[LikeRow]:
+        """
+        Copy of table data to compare with later, e.g. as cached_old_data for bulk_update.
+        Cheap replacement for deepcopy.
+        """
+        return [c.copy() if isinstance(c, LikeRow) else dict(c) for c in table_data]
+
     @classmethod
     def sort(cls, table_data: List[dict]) -> List[dict]:
         """
@@ -0,0 +1,148 @@
+import os
+import mmap
+import struct
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+# ContextManager
+class SidecarContext:
+    """
+    Table columns loaded from a sidecar, used in place of the parsed file (nothing to open or close).
+    """
+
+    def __init__(self, columns: Dict[str, list]):
+        self.columns = columns
+
+    def __enter__(self) -> 'SidecarContext':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+class TableSidecar:
+    """
+    Binary cache of parsed table columns, next to the table file (e.g. changes.xlsx.cache).
+
+    Valid only for the table file with the same fingerprint: size, mtime and content hash (sha1).
+
+    Format (versioned, read memory-mapped):
+        header: magic, version, columns count, rows count, size, mtime_ns, sha1
+        per column: key (utf-8), values (utf-8) joined with NUL
+
+    NUL and the markers for None/True/False are control characters, which can not be cell values in XLSX.
+    """
+
+    MAGIC = b'LTSC'
+    VERSION = 1
+
+    HEADER = struct.Struct('<4sHHIQq20s')
+    KEY = struct.Struct('<H')
+    VALUES = struct.Struct('<Q')
+
+    SEPARATOR = '\x00'
+    ENCODE = {None: '\x01', True: '\x02', False: '\x03'}
+    DECODE = {v: k for k, v in ENCODE.items()}
+
+    def __init__(self, filename: str):
+        """
+        Args:
+            filename: path to sidecar file
+        """
+        self.filename = filename
+
+    @classmethod
+    def fingerprint(cls, table_filename: str) -> Tuple[int, int, bytes]:
+        """
+        (size, mtime_ns, sha1 digest) of the table file.
+        """
+        st = os.stat(table_filename)
+        sha1 = hashlib.sha1()
+        with open(table_filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        return st.st_size, st.st_mtime_ns, sha1.digest()
+
+    @classmethod
+    def _encode(cls, values: list) -> bytes:
+        return cls.SEPARATOR.join(cls.ENCODE[v] if v is None or isinstance(v, bool) else str(v) for v in values).encode('utf-8')
+
+    @classmethod
+    def _decode(cls, data: bytes, num_rows: int) -> list:
+        if not num_rows:
+            return []
+        text = str(data, 'utf-8')
+        values = text.split(cls.SEPARATOR)
+        if any(marker in text for marker in cls.DECODE):
+            values = [cls.DECODE.get(v, v) for v in values]
+        return values
+
+    def load(self, fingerprint: Tuple[int, int, bytes]) -> Optional[Dict[str, list]]:
+        """
+        All columns, if the sidecar matches the table fingerprint.
+
+        Returns:
+            dict of values lists by key, or None if not usable.
+        """
+        if not os.path.isfile(self.filename) or not os.path.getsize(self.filename):
+            return None
+
+        with open(self.filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Damaged file (cut short, overwritten) is a miss, the table is parsed and the sidecar saved again
+            try:
+                return self._load(mm, fingerprint)
+            except (struct.error, UnicodeDecodeError, ValueError) as e:
+                logging.warning('Table cache damaged, ignoring: %s: %s', self.filename, e)
+                return None
+
+    def _load(self, mm: mmap.mmap, fingerprint: Tuple[int, int, bytes]) -> Optional[Dict[str, list]]:
+        magic, version, num_columns, num_rows, size, mtime_ns, sha1 = self.HEADER.unpack_from(mm, 0)
+
+        if magic != self.MAGIC or version != self.VERSION:
+            logging.info('Table cache format changed, ignoring: %s', self.filename)
+            return None
+        if (size, mtime_ns, sha1) != fingerprint:
+            return None
+
+        columns = {}
+        pos = self.HEADER.size
+        for _ in range(num_columns):
+            key_len, = self.KEY.unpack_from(mm, pos)
+            pos += self.KEY.size
+            key = str(mm[pos:pos+key_len], 'utf-8')
+            pos += key_len
+
+            values_len, = self.VALUES.unpack_from(mm, pos)
+            pos += self.VALUES.size
+            if pos + values_len > len(mm):
+                raise ValueError('column %r cut short' % key)
+
+            values = self._decode(mm[pos:pos+values_len], num_rows)
+            if len(values) != num_rows:
+                raise ValueError('column %r has %d values, expected %d' % (key, len(values), num_rows))
+            columns[key] = values
+            pos += values_len
+
+        return columns
+
+    def save(self, fingerprint: Tuple[int, int, bytes], columns: Dict[str, list]):
+        """
+        Write columns (values lists of the same length by key) for the table fingerprint, atomically.
+        """
+        num_rows = len(next(iter(columns.values()))) if columns else 0
+        size, mtime_ns, sha1 = fingerprint
+
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, len(columns), num_rows, size, mtime_ns, sha1))
+            for key, values in columns.items():
+                key_data = key.encode('utf-8')
+                f.write(self.KEY.pack(len(key_data)))
+                f.write(key_data)
+
+                data = self._encode(values)
+                f.write(self.VALUES.pack(len(data)))
+                f.write(data)
+        os.replace(tmp_filename, self.filename)
+
+# End
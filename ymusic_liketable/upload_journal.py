@@ -0,0 +1,45 @@
+import logging
+import threading
+from typing import Iterable, List
+
+class UploadJournal:
+    """
+    Journal of like mutations done online, to retry a failed upload without sending the done chunks again.
+
+    Entries are kept by snapshot: the time of the online data the mutations were computed from (online_data['time']).
+    A retried upload of the same online data (e.g. upload_changed_likes called again after an error, in the same process)
+    skips ids already done by the same method. Entries of other snapshots are ignored. clear() empties the journal
+    once an upload succeeded.
+
+    The journal is in memory only. A new run resumes an interrupted upload without it: it downloads the likes again,
+    mutations done by the interrupted run are already online and are not in the new diff.
+    """
+
+    def __init__(self):
+        self.done = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(v) for methods in self.done.values() for v in methods.values())
+
+    def pending(self, snapshot: int, method: str, ids: Iterable) -> List:
+        """
+        Ids not done yet by method, for mutations computed from the online data snapshot.
+        """
+        done = self.done.get(snapshot, {}).get(method, set())
+        if done:
+            logging.info('Resuming upload: %d mutations already done by %s', len(done), method)
+        return [i for i in ids if str(i) not in done]
+
+    def record(self, snapshot: int, method: str, ids: List):
+        """
+        Remember a completed chunk of mutations computed from the online data snapshot.
+        """
+        with self._lock:
+            self.done.setdefault(snapshot, {}).setdefault(method, set()).update(str(i) for i in ids)
+
+    def clear(self):
+        with self._lock:
+            self.done = {}
+
+# End
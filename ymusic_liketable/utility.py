@@ -1,12 +1,28 @@
 from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Iterable, List
 
+# Parsed timestamps to remember: the same like timestamp is parsed on table read, on import and on sort
+TIMESTAMP_CACHE_SIZE = 1 << 17
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
 def iso_to_utc_timestamp(iso_str: str) -> int:
     # Parse ISO 8601 string (Python 3.8 requires replacing 'Z' with '+00:00' if present)
     dt = datetime.fromisoformat(iso_str.replace('Z', '+00:00'))
-    # Convert to UTC timezone if not already UTC
-    dt_utc = dt.astimezone(timezone.utc)
-    # Return Unix timestamp as int
-    return int(dt_utc.timestamp())
+    # Unix timestamp is the same for any timezone, no conversion to UTC needed
+    return int(dt.timestamp())
+
+def iso_to_utc_timestamps(iso_strs: Iterable[str]) -> List[int]:
+    # Convert a whole column of ISO 8601 strings to Unix timestamps, empty values to 0.
+    # Each distinct value is parsed once per call, without going through the LRU cache lock again.
+    parsed = {'': 0, None: 0}
+    result = []
+    for s in iso_strs:
+        t = parsed.get(s)
+        if t is None:
+            t = parsed[s] = iso_to_utc_timestamp(s)
+        result.append(t)
+    return result
 
 def iso_to_utc_year(iso_str: str) -> int:
     # Parse ISO 8601 string (Python 3.8 requires replacing 'Z' with '+00:00' if present)
@@ -16,6 +32,35 @@ def iso_to_utc_year(iso_str: str) -> int:
     # Return year component
     return dt_utc.year
 
+def like_key(c: dict) -> tuple:
+    # Like identity (artist_id, album_id, track_id) by its most specific id: track, else album, else artist.
+    # Track rows also carry album/artist ids of the metadata, those are not part of the key.
+    if c.get('track_id'):
+        return ('', '', c['track_id'])
+    elif c.get('album_id'):
+        return ('', c['album_id'], '')
+    elif c.get('artist_id'):
+        return (c['artist_id'], '', '')
+    return ('', '', '')
+
+def like_entity(c: dict) -> str:
+    # Entity type of the like by its like key: 'tracks', 'albums', 'artists' or '' if no ids
+    artist_id, album_id, track_id = like_key(c)
+    if track_id:
+        return 'tracks'
+    elif album_id:
+        return 'albums'
+    elif artist_id:
+        return 'artists'
+    return ''
+
+# Stands for a missing key in rows_diff, so that a missing key differs from any value (None too)
+_MISSING = object()
+
+def rows_diff(a: dict, b: dict, keys: Iterable[str]) -> List[str]:
+    # Keys with values that differ between two rows, LikeRow or dict (missing key counts as different)
+    return [k for k in keys if a.get(k, _MISSING) != b.get(k, _MISSING)]
+
 # google sheets/etc auto formatting bug: turns int fields into floats, parsed as X.0 instead of X
 def strip_trailing_dot_zero(value) -> str:
     if value == None:
@@ -0,0 +1,120 @@
+import gspread.utils
+from typing import Any, Dict, Iterable, List, Tuple
+
+class WritePlanner:
+    """
+    Collects dirty cells and plans them as contiguous A1 ranges,
+    to send with as few values:batchUpdate calls as possible.
+
+    Usage:
+
+        planner.add(row, col, value)
+        for data in planner.plan_requests():
+            worksheet.batch_update(data)
+
+    Cells of the same row with adjacent columns are joined to a row range,
+    then the same column spans in adjacent rows are joined to a block range.
+    """
+
+    # Payload limit per request, in cells (Sheets API recommends requests up to ~2MB)
+    MAX_CELLS_PER_REQUEST = 20000
+
+    def __init__(self, max_cells_per_request: int=None):
+        self.max_cells_per_request = max_cells_per_request if max_cells_per_request else self.MAX_CELLS_PER_REQUEST
+        self.cells = {}
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def add(self, row: int, col: int, value: Any):
+        """
+        Mark cell dirty (1-based row/col). Later value wins.
+        """
+        self.cells[(row, col)] = value
+
+    def add_cells(self, cells: Iterable):
+        """
+        Mark dirty a list of cells with row, col, value attributes (like gspread.Cell).
+        """
+        for cell in cells:
+            self.add(cell.row, cell.col, cell.value)
+
+    def clear(self):
+        self.cells = {}
+
+    def plan_blocks(self) -> List[Tuple[int, int, int, int, List[List[Any]]]]:
+        """
+        Join dirty cells into rectangular blocks.
+
+        Returns:
+            List of (min_row, min_col, max_row, max_col, values) with 2D values row by row.
+        """
+        # Runs of adjacent columns per row
+        rows = {}
+        for (row, col) in sorted(self.cells):
+            runs = rows.setdefault(row, [])
+            if runs and runs[-1][1] == col - 1:
+                runs[-1][1] = col
+                runs[-1][2].append(self.cells[(row, col)])
+            else:
+                runs.append([col, col, [self.cells[(row, col)]]])
+
+        # Join runs with the same column span in adjacent rows
+        blocks = []
+        open_blocks = {}
+        for row in sorted(rows):
+            for min_col, max_col, values in rows[row]:
+                block = open_blocks.get((min_col, max_col))
+                if block and block[2] == row - 1:
+                    block[2] = row
+                    block[4].append(values)
+                else:
+                    block = [row, min_col, row, max_col, [values]]
+                    open_blocks[(min_col, max_col)] = block
+                    blocks.append(block)
+
+        return [tuple(b) for b in blocks]
+
+    def plan_ranges(self) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List of {'range': A1 range, 'values': 2D values} for all dirty cells,
+            with no range larger than max_cells_per_request.
+        """
+        ranges = []
+        for min_row, min_col, max_row, max_col, values in self.plan_blocks():
+            # Split blocks too large for one request by rows
+            num_rows = max(1, self.max_cells_per_request // (max_col - min_col + 1))
+            for i in range(0, len(values), num_rows):
+                part = values[i:i+num_rows]
+                start = gspread.utils.rowcol_to_a1(min_row + i, min_col)
+                end = gspread.utils.rowcol_to_a1(min_row + i + len(part) - 1, max_col)
+                ranges.append({
+                    'range': start if start == end else f'{start}:{end}',
+                    'values': part
+                })
+        return ranges
+
+    def plan_requests(self) -> List[List[Dict[str, Any]]]:
+        """
+        Returns:
+            Ranges grouped into requests (for one values:batchUpdate call each), chunked by payload size.
+        """
+        requests = []
+        data = []
+        num_cells = 0
+        for r in self.plan_ranges():
+            size = sum(len(v) for v in r['values'])
+            if data and num_cells + size > self.max_cells_per_request:
+                requests.append(data)
+                data = []
+                num_cells = 0
+            data.append(r)
+            num_cells += size
+
+        if data:
+            requests.append(data)
+
+        return requests
+
+# End
\ No newline at end of file